@@ -959,6 +959,16 @@ def _get_account_config(context: ContextTypes.DEFAULT_TYPE, name: str) -> Telegr
     )
 
 
+def _write_text_atomic(path: str, content: str) -> None:
+    """Write via a temp file and os.replace so a crash never leaves a torn file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file_handle:
+        file_handle.write(content)
+        file_handle.flush()
+        os.fsync(file_handle.fileno())
+    os.replace(tmp_path, path)
+
+
 def _persist_accounts_json(accounts: list[TelegramAccountConfig]) -> str:
     data = [item.model_dump() for item in accounts]
     serialized = json.dumps(data, ensure_ascii=True, separators=(",", ":"))
@@ -973,8 +983,7 @@ def _persist_accounts_json(accounts: list[TelegramAccountConfig]) -> str:
             break
     if not updated:
         lines.append(f"TELEGRAM_ACCOUNTS_JSON='{serialized}'")
-    with open(path, "w", encoding="utf-8") as file_handle:
-        file_handle.write("\n".join(lines) + "\n")
+    _write_text_atomic(path, "\n".join(lines) + "\n")
     return serialized
 
 
@@ -1000,8 +1009,7 @@ def _persist_admins_json(admins: dict[int, dict[str, object]]) -> str:
             break
     if not updated:
         lines.append(f"TG_BOT_ADMINS_JSON={serialized}")
-    with open(path, "w", encoding="utf-8") as file_handle:
-        file_handle.write("\n".join(lines) + "\n")
+    _write_text_atomic(path, "\n".join(lines) + "\n")
     return serialized
 
 
@@ -2807,8 +2815,7 @@ async def _update_prompt(
         if account.openai and account.openai.system_prompt_path
         else f"openai_prompt_{account_name}.txt"
     )
-    with open(prompt_path, "w", encoding="utf-8") as file_handle:
-        file_handle.write(text.strip() + "\n")
+    _write_text_atomic(prompt_path, text.strip() + "\n")
     if not account.openai:
         account.openai = OpenAIAccountConfig()
     account.openai.system_prompt_path = prompt_path
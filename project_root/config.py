@@ -258,6 +258,10 @@ class Config(BaseSettings):
     OPENAI_TEXT_INPUT_PRICE_PER_1M: float = Field(default=0.15)
     OPENAI_TEXT_OUTPUT_PRICE_PER_1M: float = Field(default=0.60)
     OPENAI_IMAGE_PRICE_1024_USD: float = Field(default=0.042)
+    # Общий бюджет запросов к OpenAI на API-ключ (0 = без ограничения)
+    OPENAI_MAX_TOKENS_PER_MINUTE: int = Field(default=0)
+    OPENAI_MAX_REQUESTS_PER_MINUTE: int = Field(default=0)
+    OPENAI_MAX_CONCURRENT_REQUESTS: int = Field(default=8)
     POSTING_MODE: Optional[str] = Field(default="TEXT")
     POSTING_INTERVAL_SECONDS: int = Field(default=300)
     MIN_TEXT_LENGTH: int = Field(default=100)
@@ -295,6 +299,8 @@ class Config(BaseSettings):
     AD_FILTER_ENABLED: bool = Field(default=False)
     AD_FILTER_THRESHOLD: int = Field(default=3)
     AD_FILTER_KEYWORDS: Optional[str] = Field(default=None)
+    # Debug: raise on accidental lazy loads in hot DB read paths (N+1 guard).
+    DB_RAISELOAD: bool = Field(default=False)
     SERVICE_SLEEP_MIN_SECONDS: float = Field(default=30.0)
     SERVICE_SLEEP_MAX_SECONDS: float = Field(default=90.0)
     SOURCE_SELECTION_MODE: str = Field(default="ROUND_ROBIN")
@@ -4,12 +4,15 @@ from __future__ import annotations
 
 from contextlib import contextmanager
 from datetime import datetime, timezone
+from types import SimpleNamespace
 from typing import Generator, Iterable
 import json
+import logging
+import time
 
-from sqlalchemy import create_engine, select, text
+from sqlalchemy import bindparam, create_engine, event, insert, select, text, update
 from sqlalchemy.engine import Engine
-from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.orm import Session, raiseload, selectinload, sessionmaker, undefer
 
 from project_root.config import Config, PipelineConfig
 from project_root.models import (
@@ -30,28 +33,64 @@ from project_root.models import (
     UserbotPersona,
 )
 
+logger = logging.getLogger(__name__)
+
+# Размер LRU-кэша скомпилированных SQL (по умолчанию у SQLAlchemy 500).
+QUERY_CACHE_SIZE = 2000
+
+
+_SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+)
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in _SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
 
 def create_db_engine() -> Engine:
-    """Create a SQLite engine."""
-    return create_engine(
+    """Create a SQLite engine (WAL journal, tuned PRAGMAs on every connection)."""
+    engine = create_engine(
         "sqlite:///./tg_post_service.db",
         connect_args={"check_same_thread": False},
         future=True,
+        query_cache_size=QUERY_CACHE_SIZE,
+        # Локальный файл: ping не нужен, соединения переиспользуются из пула.
+        # StaticPool не подходит — сессии планировщика и бота живут параллельно.
+        pool_size=5,
+        max_overflow=10,
+        pool_pre_ping=False,
     )
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
+    return engine
 
 
-def _naive_utc(value: datetime) -> datetime:
+def naive_utc(value: datetime) -> datetime:
+    """Convert to naive UTC; naive values are assumed to be UTC already."""
     if value.tzinfo is None:
         return value
     return value.astimezone(timezone.utc).replace(tzinfo=None)
 
 
 ENGINE = create_db_engine()
+# Включается через DB_RAISELOAD: ленивые загрузки в горячих путях падают с ошибкой.
+_RAISELOAD_ENABLED = False
 SessionLocal = sessionmaker(bind=ENGINE, expire_on_commit=False, class_=Session)
 
 
 def init_db(config: Config) -> None:
     """Create tables and seed initial data based on configuration."""
+    global _RAISELOAD_ENABLED
+    _RAISELOAD_ENABLED = bool(getattr(config, "DB_RAISELOAD", False))
     Base.metadata.create_all(bind=ENGINE)
     _ensure_global_state_schema()
     _ensure_pipelines_schema()
@@ -60,6 +99,7 @@ def init_db(config: Config) -> None:
     _ensure_discussion_replies_schema()
     _ensure_userbot_persona_schema()
     _ensure_post_history_schema()
+    _ensure_indexes()
     with SessionLocal() as session:
         _ensure_pipelines(session, config.pipelines)
         _ensure_pipeline_states(session)
@@ -68,6 +108,26 @@ def init_db(config: Config) -> None:
         _seed_userbot_persona(session, [item.name for item in config.telegram_accounts()])
         _sync_discussion_bot_weights(session, config)
         session.commit()
+    _log_statement_cache_info()
+
+
+def _log_statement_cache_info() -> None:
+    """Log whether the compiled statement cache is active and how it is sized."""
+    cache = getattr(ENGINE, "_compiled_cache", None)
+    dialect = ENGINE.dialect
+    if cache is None:
+        logger.warning(
+            "SQLAlchemy statement cache disabled (dialect=%s supports_statement_cache=%s)",
+            dialect.name,
+            getattr(dialect, "supports_statement_cache", None),
+        )
+        return
+    logger.info(
+        "SQLAlchemy statement cache: dialect=%s capacity=%s entries=%s",
+        dialect.name,
+        getattr(cache, "capacity", QUERY_CACHE_SIZE),
+        len(cache),
+    )
 
 
 def _ensure_source_channels(session: Session, channels: Iterable[str]) -> None:
@@ -274,7 +334,7 @@ def _ensure_discussion_replies_schema() -> None:
 
 
 def _ensure_post_history_schema() -> None:
-    """Add destination_channel and channel_message_id to post_history if missing."""
+    """Add destination_channel, channel_message_id and text_hash to post_history if missing."""
     with ENGINE.connect() as connection:
         result = connection.execute(text("PRAGMA table_info(post_history)"))
         columns = {row[1] for row in result.fetchall()}
@@ -286,6 +346,29 @@ def _ensure_post_history_schema() -> None:
             connection.execute(
                 text("ALTER TABLE post_history ADD COLUMN channel_message_id INTEGER")
             )
+        if "text_hash" not in columns:
+            connection.execute(
+                text("ALTER TABLE post_history ADD COLUMN text_hash BIGINT")
+            )
+        connection.commit()
+
+
+def _ensure_indexes() -> None:
+    """Create model indexes missing on existing databases (create_all skips them)."""
+    with ENGINE.connect() as connection:
+        # Заменён составным ix_invite_token_code.
+        connection.execute(text("DROP INDEX IF EXISTS ix_bot_invite_codes_token"))
+        # Частичный индекс по pending-ответам планировщик не выбирал (статус — bind-параметр).
+        connection.execute(text("DROP INDEX IF EXISTS ix_reply_due"))
+        # is_enabled фильтруется в Python по уже загруженным пайплайнам: индекс не читался.
+        connection.execute(text("DROP INDEX IF EXISTS ix_pipelines_enabled"))
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                try:
+                    index.create(bind=connection, checkfirst=True)
+                except Exception:
+                    # Уникальный индекс не создастся, если в таблице уже есть дубли.
+                    logger.exception("Failed to create index %s", index.name)
         connection.commit()
 
 
@@ -680,8 +763,26 @@ def _ensure_discussion_states(session: Session) -> None:
             )
 
 
+def _hot_path_options(*loaders):
+    """Loader options for hot read paths; adds raiseload('*') in debug mode."""
+    if _RAISELOAD_ENABLED:
+        return (*loaders, raiseload("*"))
+    return loaders
+
+
 def get_all_pipelines(session: Session) -> list[Pipeline]:
-    return session.execute(select(Pipeline).order_by(Pipeline.id)).scalars().all()
+    stmt = (
+        select(Pipeline)
+        .options(
+            *_hot_path_options(
+                selectinload(Pipeline.sources),
+                selectinload(Pipeline.state),
+                selectinload(Pipeline.discussion_settings),
+            )
+        )
+        .order_by(Pipeline.id)
+    )
+    return session.execute(stmt).scalars().all()
 
 
 def get_pipeline_sources(session: Session, pipeline_id: int) -> list[PipelineSource]:
@@ -723,7 +824,7 @@ def create_pipeline(session: Session, config: PipelineConfig) -> Pipeline:
         interval_seconds=config.interval_seconds,
         blackbox_every_n=config.blackbox_every_n,
         pipeline_type=config.pipeline_type,
-        is_enabled=1,
+        is_enabled=True,
     )
     session.add(pipeline)
     session.flush()
@@ -813,8 +914,8 @@ def update_pipeline_mode(session: Session, pipeline: Pipeline, mode: str) -> Non
 
 
 def toggle_pipeline_enabled(session: Session, pipeline: Pipeline) -> bool:
-    pipeline.is_enabled = 0 if pipeline.is_enabled else 1
-    return bool(pipeline.is_enabled)
+    pipeline.is_enabled = not pipeline.is_enabled
+    return pipeline.is_enabled
 
 
 def add_pipeline_source(
@@ -1080,9 +1181,10 @@ def create_discussion_reply(
     reply_to_message_id: int | None,
     source_message_at: datetime | None = None,
 ) -> DiscussionReply:
-    send_at = _naive_utc(send_at)
-    if source_message_at is not None:
-        source_message_at = _naive_utc(source_message_at)
+    if send_at.tzinfo is not None:
+        send_at = naive_utc(send_at)
+    if source_message_at is not None and source_message_at.tzinfo is not None:
+        source_message_at = naive_utc(source_message_at)
     reply = DiscussionReply(
         pipeline_id=pipeline_id,
         kind=kind,
@@ -1096,11 +1198,64 @@ def create_discussion_reply(
         sent_at=None,
         cancelled_reason=None,
     )
+    # Без немедленного flush: ответы одного цикла уходят в БД одним пакетом
+    # (insertmanyvalues) при следующем autoflush/commit.
     session.add(reply)
-    session.flush()
     return reply
 
 
+def create_discussion_replies(session: Session, rows: list[dict]) -> None:
+    """Insert several pending replies in one executemany (insertmanyvalues) statement."""
+    if not rows:
+        return
+    values = []
+    for row in rows:
+        send_at = row["send_at"]
+        source_message_at = row.get("source_message_at")
+        values.append(
+            {
+                "pipeline_id": row["pipeline_id"],
+                "kind": row.get("kind", "discussion"),
+                "chat_id": row.get("chat_id"),
+                "account_name": row["account_name"],
+                "reply_text": row["reply_text"],
+                "send_at": naive_utc(send_at) if send_at.tzinfo is not None else send_at,
+                "status": "pending",
+                "reply_to_message_id": row.get("reply_to_message_id"),
+                "source_message_at": (
+                    naive_utc(source_message_at)
+                    if source_message_at is not None and source_message_at.tzinfo is not None
+                    else source_message_at
+                ),
+                "sent_at": None,
+                "cancelled_reason": None,
+            }
+        )
+    session.execute(insert(DiscussionReply), values)
+
+
+# Запросы горячего пути собраны один раз: значения идут через bindparam,
+# поэтому каждый вызов попадает в одну и ту же ячейку кэша компиляции.
+_DUE_REPLIES_STMT = (
+    select(DiscussionReply)
+    .where(
+        DiscussionReply.pipeline_id == bindparam("pipeline_id"),
+        DiscussionReply.status == "pending",
+        DiscussionReply.send_at <= bindparam("now"),
+    )
+    .order_by(DiscussionReply.send_at)
+    # Due-ответы сразу отправляются — текст нужен, грузим одним запросом.
+    .options(undefer(DiscussionReply.reply_text))
+)
+_DUE_REPLIES_BY_KIND_STMT = _DUE_REPLIES_STMT.where(
+    DiscussionReply.kind == bindparam("kind")
+)
+_CHAT_STATE_STMT = select(ChatState).where(
+    ChatState.pipeline_id == bindparam("pipeline_id"),
+    ChatState.chat_id == bindparam("chat_id"),
+)
+
+
 def list_due_discussion_replies(
     session: Session,
     pipeline_id: int,
@@ -1108,43 +1263,56 @@ def list_due_discussion_replies(
     *,
     kind: str | None = None,
 ) -> list[DiscussionReply]:
-    now = _naive_utc(now)
+    # Планировщик передаёт уже нормализованный now; конвертируем только aware.
+    if now.tzinfo is not None:
+        now = naive_utc(now)
+    params = {"pipeline_id": pipeline_id, "now": now}
+    stmt = _DUE_REPLIES_STMT
+    if kind:
+        stmt = _DUE_REPLIES_BY_KIND_STMT
+        params["kind"] = kind
     return (
-        session.execute(
-            select(DiscussionReply)
-            .where(
-                DiscussionReply.pipeline_id == pipeline_id,
-                DiscussionReply.status == "pending",
-                DiscussionReply.send_at <= now,
-                *( [DiscussionReply.kind == kind] if kind else []),
-            )
-            .order_by(DiscussionReply.send_at)
-        )
+        session.execute(stmt.options(*_hot_path_options()), params)
         .scalars()
         .all()
     )
 
 
-def mark_discussion_reply_sent(
-    session: Session, reply: DiscussionReply, sent_at: datetime
+def mark_discussion_replies_sent(
+    session: Session, reply_ids: Iterable[int], sent_at: datetime
 ) -> None:
-    reply.status = "sent"
-    reply.sent_at = _naive_utc(sent_at)
+    """Mark replies sent with one UPDATE ... WHERE id IN (...)."""
+    ids = list(reply_ids)
+    if not ids:
+        return
+    session.execute(
+        update(DiscussionReply)
+        .where(DiscussionReply.id.in_(ids))
+        .values(
+            status="sent",
+            sent_at=naive_utc(sent_at) if sent_at.tzinfo is not None else sent_at,
+        )
+    )
 
 
-def mark_discussion_reply_cancelled(
-    session: Session, reply: DiscussionReply, reason: str
+def mark_discussion_replies_cancelled(
+    session: Session, reply_ids: Iterable[int], reason: str
 ) -> None:
-    reply.status = "cancelled"
-    reply.cancelled_reason = reason
+    """Cancel replies with one UPDATE ... WHERE id IN (...)."""
+    ids = list(reply_ids)
+    if not ids:
+        return
+    session.execute(
+        update(DiscussionReply)
+        .where(DiscussionReply.id.in_(ids))
+        .values(status="cancelled", cancelled_reason=reason)
+    )
 
 
 def get_chat_state(session: Session, pipeline_id: int, chat_id: str) -> ChatState:
     state = session.execute(
-        select(ChatState).where(
-            ChatState.pipeline_id == pipeline_id,
-            ChatState.chat_id == chat_id,
-        )
+        _CHAT_STATE_STMT.options(*_hot_path_options()),
+        {"pipeline_id": pipeline_id, "chat_id": chat_id},
     ).scalar_one_or_none()
     if state is None:
         state = ChatState(
@@ -1161,6 +1329,45 @@ def get_chat_state(session: Session, pipeline_id: int, chat_id: str) -> ChatStat
     return state
 
 
+# Кэш персон для горячего пути генерации ответов: персоны меняются редко
+# (через админ-бота), а читаются на каждый ответ. Сбрасывается ORM-событиями
+# и по TTL — на случай правок БД из внешних скриптов.
+PERSONA_CACHE_TTL_SECONDS = 30.0
+_PERSONA_CACHE: dict[str, tuple[float, SimpleNamespace | None]] = {}
+
+
+def get_userbot_persona_cached(
+    session: Session, account_name: str
+) -> SimpleNamespace | None:
+    """Read-only persona snapshot (attribute access like UserbotPersona), TTL-cached."""
+    now = time.monotonic()
+    cached = _PERSONA_CACHE.get(account_name)
+    if cached is not None and now - cached[0] < PERSONA_CACHE_TTL_SECONDS:
+        return cached[1]
+    row = get_userbot_persona(session, account_name)
+    snapshot = None
+    if row is not None:
+        snapshot = SimpleNamespace(
+            **{column.key: getattr(row, column.key) for column in UserbotPersona.__table__.columns}
+        )
+    _PERSONA_CACHE[account_name] = (now, snapshot)
+    return snapshot
+
+
+def invalidate_persona_cache(account_name: str | None = None) -> None:
+    if account_name is None:
+        _PERSONA_CACHE.clear()
+    else:
+        _PERSONA_CACHE.pop(account_name, None)
+
+
+@event.listens_for(UserbotPersona, "after_insert")
+@event.listens_for(UserbotPersona, "after_update")
+@event.listens_for(UserbotPersona, "after_delete")
+def _on_persona_changed(mapper, connection, target: UserbotPersona) -> None:
+    invalidate_persona_cache(target.account_name)
+
+
 def get_userbot_persona(session: Session, account_name: str) -> UserbotPersona | None:
     return session.execute(
         select(UserbotPersona).where(UserbotPersona.account_name == account_name)
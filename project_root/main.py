@@ -7,9 +7,14 @@ import logging
 import os
 import sys
 
+try:
+    import uvloop
+except ImportError:  # pragma: no cover - Windows или uvloop не установлен
+    uvloop = None
+
 from project_root.config import Config
 from project_root.db import init_db
-from project_root.openai_client import OpenAIClient
+from project_root.openai_client import OpenAIClient, configure_rate_limits
 from project_root.scheduler import run_service
 from project_root.telegram_client import create_client
 from project_root.runtime import AccountRuntime
@@ -32,10 +37,17 @@ def setup_logging() -> None:
 
 async def main_async() -> None:
     setup_logging()
+    eager_task_factory = getattr(asyncio, "eager_task_factory", None)  # Python 3.12+
+    if eager_task_factory is not None:
+        # Задачи, завершающиеся без ожидания (кэш, пропуски по лимитам), не ходят через цикл
+        asyncio.get_running_loop().set_task_factory(eager_task_factory)
     config = Config()
     config.apply_behavior_profiles()
     logging.getLogger(__name__).info("Configuration loaded, starting service")
     init_db(config)
+    configure_rate_limits(
+        config.OPENAI_MAX_TOKENS_PER_MINUTE, config.OPENAI_MAX_REQUESTS_PER_MINUTE
+    )
     accounts = await _build_account_runtimes(config)
     bot_app = None
     if config.TG_BOT_TOKEN:
@@ -49,8 +61,11 @@ async def main_async() -> None:
 
 
 def main() -> None:
+    # uvloop (libuv) снижает накладные расходы цикла на каждый RPC; без него — стандартный цикл
+    loop_factory = uvloop.new_event_loop if uvloop is not None else None
     try:
-        asyncio.run(main_async())
+        with asyncio.Runner(loop_factory=loop_factory) as runner:
+            runner.run(main_async())
     except KeyboardInterrupt:
         sys.stdout.write("Service остановлен пользователем.\n")
 
@@ -5,10 +5,33 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    DateTime,
+    Enum,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    func,
+    text,
+)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
+POSTING_MODES = ("TEXT", "TEXT_IMAGE", "TEXT_MEDIA", "PLAGIAT")
+PIPELINE_TYPES = ("STANDARD", "DISCUSSION")
+REPLY_KINDS = ("discussion", "user_reply")
+REPLY_STATUSES = ("pending", "sent", "cancelled")
+
+
+def _str_enum(*values: str, name: str) -> Enum:
+    """Non-native string enum: values stay plain str, column stays VARCHAR on SQLite."""
+    return Enum(*values, name=name, native_enum=False, create_constraint=False)
+
+
 class Base(DeclarativeBase):
     """Base class for ORM models."""
 
@@ -19,8 +42,8 @@ class SourceChannel(Base):
     __tablename__ = "source_channels"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    channel_identifier: Mapped[str] = mapped_column(String, unique=True, nullable=False)
-    last_message_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    channel_identifier: Mapped[str] = mapped_column(String(128), unique=True, nullable=False)
+    last_message_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
 
 
 class GlobalState(Base):
@@ -39,28 +62,40 @@ class Pipeline(Base):
     __tablename__ = "pipelines"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    name: Mapped[str] = mapped_column(String, unique=True, nullable=False, index=True)
+    name: Mapped[str] = mapped_column(String(128), unique=True, nullable=False, index=True)
     account_name: Mapped[str] = mapped_column(
         String, nullable=False, default="default"
     )
-    is_enabled: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
+    is_enabled: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
     destination_channel: Mapped[str] = mapped_column(String, nullable=False)
-    posting_mode: Mapped[str] = mapped_column(String, nullable=False)
-    pipeline_type: Mapped[str] = mapped_column(String, nullable=False, default="STANDARD")
+    posting_mode: Mapped[str] = mapped_column(
+        _str_enum(*POSTING_MODES, name="posting_mode"), nullable=False
+    )
+    pipeline_type: Mapped[str] = mapped_column(
+        _str_enum(*PIPELINE_TYPES, name="pipeline_type"), nullable=False, default="STANDARD"
+    )
     interval_seconds: Mapped[int] = mapped_column(Integer, nullable=False)
     blackbox_every_n: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
 
     sources: Mapped[list["PipelineSource"]] = relationship(
-        "PipelineSource", back_populates="pipeline", cascade="all, delete-orphan"
+        "PipelineSource",
+        back_populates="pipeline",
+        cascade="all, delete-orphan",
+        lazy="selectin",
     )
     state: Mapped[Optional["PipelineState"]] = relationship(
-        "PipelineState", back_populates="pipeline", uselist=False, cascade="all, delete-orphan"
+        "PipelineState",
+        back_populates="pipeline",
+        uselist=False,
+        cascade="all, delete-orphan",
+        lazy="selectin",
     )
     discussion_settings: Mapped[Optional["DiscussionSettings"]] = relationship(
         "DiscussionSettings",
         back_populates="pipeline",
         uselist=False,
         cascade="all, delete-orphan",
+        lazy="selectin",
     )
 
 
@@ -68,11 +103,14 @@ class PipelineSource(Base):
     """Links a pipeline to its source channels."""
 
     __tablename__ = "pipeline_sources"
+    __table_args__ = (
+        Index("ix_pipeline_sources_pipeline", "pipeline_id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     pipeline_id: Mapped[int] = mapped_column(ForeignKey("pipelines.id"), nullable=False)
     source_channel: Mapped[str] = mapped_column(String, nullable=False)
-    last_message_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    last_message_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
 
     pipeline: Mapped["Pipeline"] = relationship("Pipeline", back_populates="sources")
 
@@ -96,13 +134,23 @@ class PostHistory(Base):
     """Stores recent original texts for deduplication."""
 
     __tablename__ = "post_history"
+    __table_args__ = (
+        Index("ix_post_history_pipeline_created", "pipeline_id", "created_at"),
+        # Окно дедупликации: WHERE pipeline_id=? ORDER BY id DESC LIMIT n — чтение диапазона индекса.
+        Index("ix_post_history_pipeline_id_desc", "pipeline_id", text("id DESC")),
+        Index("ix_post_history_pipeline_text_hash", "pipeline_id", "text_hash"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     pipeline_id: Mapped[int] = mapped_column(ForeignKey("pipelines.id"), nullable=False)
     text: Mapped[str] = mapped_column(Text, nullable=False)
-    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, nullable=False, server_default=func.now()
+    )
     destination_channel: Mapped[Optional[str]] = mapped_column(String, nullable=True)
-    channel_message_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    channel_message_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    # Signed 64-bit hash of the stripped text; NULL for rows stored before it existed.
+    text_hash: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
 
     pipeline: Mapped["Pipeline"] = relationship("Pipeline")
 
@@ -113,11 +161,13 @@ class BotInvite(Base):
     __tablename__ = "bot_invites"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    token: Mapped[str] = mapped_column(String, unique=True, nullable=False, index=True)
-    created_by: Mapped[int] = mapped_column(Integer, nullable=False)
-    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    token: Mapped[str] = mapped_column(String(64), unique=True, nullable=False, index=True)
+    created_by: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, nullable=False, server_default=func.now()
+    )
     expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
-    used_by: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    used_by: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
     used_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
 
 
@@ -125,12 +175,15 @@ class BotInviteCode(Base):
     """Stores one-time codes for invite confirmation."""
 
     __tablename__ = "bot_invite_codes"
+    __table_args__ = (Index("ix_invite_token_code", "token", "code"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    token: Mapped[str] = mapped_column(String, nullable=False, index=True)
-    code: Mapped[str] = mapped_column(String, nullable=False)
-    created_for: Mapped[int] = mapped_column(Integer, nullable=False)
-    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    token: Mapped[str] = mapped_column(String(64), nullable=False)
+    code: Mapped[str] = mapped_column(String(64), nullable=False)
+    created_for: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, nullable=False, server_default=func.now()
+    )
     expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
     used_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
 
@@ -186,17 +239,17 @@ class DiscussionState(Base):
     pipeline_id: Mapped[int] = mapped_column(
         ForeignKey("pipelines.id"), primary_key=True
     )
-    question_message_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    question_message_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
     question_created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     replies_planned: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
     replies_sent: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
     last_bot_reply_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
-    last_reply_parent_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    last_reply_parent_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
     last_bot_reply_message_id: Mapped[Optional[int]] = mapped_column(
-        Integer, nullable=True
+        BigInteger, nullable=True
     )
-    last_source_post_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    last_source_post_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
     last_source_post_at: Mapped[Optional[datetime]] = mapped_column(
         DateTime, nullable=True
     )
@@ -209,16 +262,25 @@ class DiscussionReply(Base):
     """Scheduled replies for a discussion."""
 
     __tablename__ = "discussion_replies"
+    __table_args__ = (
+        Index("ix_discussion_replies_status_send_at", "status", "send_at"),
+        Index("ix_discussion_replies_pipeline_status", "pipeline_id", "status"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     pipeline_id: Mapped[int] = mapped_column(ForeignKey("pipelines.id"), nullable=False)
-    kind: Mapped[str] = mapped_column(String, nullable=False, default="discussion")
+    kind: Mapped[str] = mapped_column(
+        _str_enum(*REPLY_KINDS, name="reply_kind"), nullable=False, default="discussion"
+    )
     chat_id: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     account_name: Mapped[str] = mapped_column(String, nullable=False)
-    reply_text: Mapped[str] = mapped_column(Text, nullable=False)
+    # Крупная колонка: грузится только там, где ответ реально отправляется.
+    reply_text: Mapped[str] = mapped_column(Text, nullable=False, deferred=True)
     send_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
-    status: Mapped[str] = mapped_column(String, nullable=False, default="pending")
-    reply_to_message_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    status: Mapped[str] = mapped_column(
+        _str_enum(*REPLY_STATUSES, name="reply_status"), nullable=False, default="pending"
+    )
+    reply_to_message_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
     source_message_at: Mapped[Optional[datetime]] = mapped_column(
         DateTime, nullable=True
     )
@@ -230,11 +292,14 @@ class ChatState(Base):
     """Tracks reading state for discussion chats."""
 
     __tablename__ = "chat_state"
+    __table_args__ = (
+        Index("ix_chat_state_pipeline_chat", "pipeline_id", "chat_id", unique=True),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     pipeline_id: Mapped[int] = mapped_column(ForeignKey("pipelines.id"), nullable=False)
     chat_id: Mapped[str] = mapped_column(String, nullable=False)
-    last_seen_message_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    last_seen_message_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
     last_human_message_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     replies_today: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
     replies_today_date: Mapped[Optional[str]] = mapped_column(String, nullable=True)
@@ -245,6 +310,11 @@ class DiscussionBotWeight(Base):
     """Weights and limits for discussion bots."""
 
     __tablename__ = "discussion_bot_weights"
+    __table_args__ = (
+        Index(
+            "ix_bot_weights_pipeline_account", "pipeline_id", "account_name", unique=True
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     pipeline_id: Mapped[int] = mapped_column(ForeignKey("pipelines.id"), nullable=False)
@@ -263,7 +333,7 @@ class UserbotPersona(Base):
     __tablename__ = "userbot_persona"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    account_name: Mapped[str] = mapped_column(String, unique=True, nullable=False)
+    account_name: Mapped[str] = mapped_column(String(128), unique=True, nullable=False)
     persona_tone: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     persona_verbosity: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     persona_style_hint: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
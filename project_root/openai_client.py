@@ -2,24 +2,52 @@
 
 from __future__ import annotations
 
-import base64
+import asyncio
+import hashlib
 import json
 import logging
 import random
 import time
-from typing import Any, Callable, Optional, Tuple, TypeVar
-
-from openai import OpenAI
+from base64 import b64encode
+from binascii import a2b_base64
+from bisect import bisect_right
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import accumulate
+from types import MappingProxyType
+from typing import Any, Awaitable, Callable, Mapping, Optional, Tuple, TypeVar
+
+import httpx
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    AsyncOpenAI,
+    DefaultAsyncHttpxClient,
+    InternalServerError,
+    RateLimitError,
+)
+
+try:  # aiohttp-транспорт: pip install "openai[aiohttp]"
+    from openai import DefaultAioHttpClient
+except ImportError:  # pragma: no cover - старый SDK или нет aiohttp
+    DefaultAioHttpClient = None
+
+from project_root.utils import json_dumps, json_loads
 
 logger = logging.getLogger(__name__)
 
+# Общий неизменяемый пустой extra для логов usage: без нового dict на каждый вызов
+_EMPTY_EXTRA: Mapping[str, Any] = MappingProxyType({})
+
+
 # Контракт persona_meta: допустимые значения (P1 устойчивость)
-VALID_TONES = {"neutral", "analytical", "emotional", "ironic", "skeptical"}
-VALID_VERBOSITY = {"short", "medium", "long"}
-VALID_GENDER = {"male", "female"}
+VALID_TONES = frozenset({"neutral", "analytical", "emotional", "ironic", "skeptical"})
+VALID_VERBOSITY = frozenset({"short", "medium", "long"})
+VALID_GENDER = frozenset({"male", "female"})
+_DEFAULT_PERSONA_META = ("neutral", "short", "male")
 
 # Большой пул вводных фраз для вариативности ответов (модель получает случайную выборку каждый раз)
-REPLY_OPENING_POOL = [
+REPLY_OPENING_POOL: tuple[str, ...] = (
     "Согласен", "Согласна", "Не совсем согласен", "Не совсем согласна",
     "Не уверен", "Не уверена", "Мне кажется", "Честно говоря", "Если честно",
     "Скорее всего", "Ну тут спорно", "Тут есть нюанс", "Я бы уточнил", "Я бы уточнила",
@@ -29,10 +57,11 @@ REPLY_OPENING_POOL = [
     "Интересно", "Любопытно", "Тут другой момент", "Я бы поспорил", "Я бы поспорила",
     "Не думаю", "Вряд ли", "Возможно", "В какой-то степени", "Сложно сказать",
     "Обычно да", "Чаще всего", "Бывает по-разному", "Тут как посмотреть",
-]
+)
 
 # Сколько вводных показывать модели в одном запросе (случайная выборка)
 REPLY_OPENING_SAMPLE_SIZE = 12
+assert len(REPLY_OPENING_POOL) >= REPLY_OPENING_SAMPLE_SIZE
 
 # Вариативность формулировок вопроса ведущего. Типы по смыслу новости (5–7 на группу).
 ADMIN_QUESTION_TAXONOMY: dict[str, list[str]] = {
@@ -84,17 +113,343 @@ ADMIN_QUESTION_TAXONOMY: dict[str, list[str]] = {
 }
 
 # Объединённый пул для случайной выборки (все из таксономии)
-ADMIN_QUESTION_PHRASING_POOL: list[str] = []
+_phrasing: list[str] = []
 for _qlist in ADMIN_QUESTION_TAXONOMY.values():
-    ADMIN_QUESTION_PHRASING_POOL.extend(_qlist)
-ADMIN_QUESTION_PHRASING_POOL = list(dict.fromkeys(ADMIN_QUESTION_PHRASING_POOL))
+    _phrasing.extend(_qlist)
+ADMIN_QUESTION_PHRASING_POOL: tuple[str, ...] = tuple(dict.fromkeys(_phrasing))
 ADMIN_QUESTION_SAMPLE_SIZE = 12
 
+# Таксономия: подбирай тип вопроса по смыслу новости (конфликт/геополитика, товары/цены, природа/здоровье, культура/медиа, экономика/общество)
+_TAXONOMY_BLOCK = (
+    "Типы вопросов по смыслу новости (выбери группу и один из вариантов или свой в том же духе):\n"
+    + "\n".join(
+        f"- {group_name}: " + " | ".join(questions)
+        for group_name, questions in ADMIN_QUESTION_TAXONOMY.items()
+    )
+)
+
+# Статические части промптов собираются один раз при импорте
+_QUESTION_VARIETY_HINT = (
+    "Вопрос ведущего (поле question) обязательно должен состоять из двух частей: (1) кратко суть новости (1–2 предложения), "
+    "чтобы в чате было понятно, о чём речь; (2) вопрос к аудитории. "
+    "Подбирай формулировку под смысл: для конфликтов/инцидентов — «кто за этим?», «кому выгодно?»; "
+    "для товаров/цен — «вы бы купили?», «какая у вас машина?»; "
+    "для природы/здоровья — «готовы ли к такому?», «как повлияет на вас?»; "
+    "для культуры/трендов — «как вам история?», «согласны с развитием?». "
+    "Нельзя выводить в question только короткую фразу без контекста.\n\n"
+    + _TAXONOMY_BLOCK
+)
+
+_DISCUSSION_STYLE_RULES = (
+    "Требования к стилю:\n"
+    "- В question всегда сначала изложи суть новости, затем задай вопрос к чату. Короткий вопрос без контекста (только «Как вы это восприняли?» и т.п.) запрещён.\n"
+    "- Диалог должен выглядеть как реальная беседа людей, а не как ответы на экзамене.\n"
+    "- Не использовать формулировки типа: «Это может», «Это может привести», «Это может повлиять».\n"
+    "- Избегать канцелярита и журналистского стиля.\n"
+    "- Ответы должны различаться по длине.\n"
+    "- Допускается лёгкое несогласие между участниками.\n"
+    "- Можно реагировать на предыдущие ответы (соглашаться, спорить, уточнять).\n"
+    "- Не повторять формулировки друг друга.\n"
+    "- Не использовать абстрактные конструкции вроде «общественное восприятие», «социальный эффект», «некоторые могут считать».\n"
+    "- Разнообразь вводные: не все ответы должны начинаться с «Согласна», «Не уверен», «Если честно», «Интересно». Используй разные начала: «Скорее всего», «Тут есть нюанс», «Ну тут спорно», «Логично», «С другой стороны», «Зависит», «Похоже на то», «Вряд ли», «Хм», или начинай сразу по делу.\n"
+    "- Не все участники должны быть аналитиками — допускается бытовой язык.\n"
+    "- Пунктуация: естественная. Не обязательно всегда ставить точку в конце. Запятые — где уместно. Никогда не используй длинное тире (—).\n\n"
+)
+
+# Неизменные правила обсуждения (P1): дописываются к system-сообщению, чтобы весь
+# статический текст шёл единым префиксом для prompt cache OpenAI; в user — только
+# переменные части (число ответов, последние вопросы, роли, новость)
+_DISCUSSION_PROMPT_PREFIX = (
+    "Сгенерируй живое обсуждение новости для Telegram-чата.\n"
+    "Верни JSON строго вида:\n"
+    "{\"question\": \"...\", \"replies\": [\"...\", ...]}\n\n"
+    + _QUESTION_VARIETY_HINT
+    + "\n\n"
+    + _DISCUSSION_STYLE_RULES
+)
+
+# Общие правила ответа в живом чате (P2); для emotional — с дополнительной строкой
+_COMMON_RULES_BASE = (
+    "Ты участник живого Telegram-чата. Пиши как живой человек, не как эксперт и не как статья.\n\n"
+    "Обязательно:\n"
+    "- Выбери одну фразу или деталь из сообщения пользователя и отвечай именно на неё; не пересказывай весь вопрос.\n"
+    "- Не копируй формулировки пользователя дословно — перефразируй своими словами.\n"
+    "- Не начинай со слов: «Это может», «Это может привести», «Это может повлиять».\n"
+    "- Избегай канцелярита и журналистского тона.\n"
+    "- Иногда отвечай сразу по делу, не всегда с вводных («Скорее всего», «Честно говоря» и т.п.).\n"
+    "- Согласие, сомнение и лёгкое несогласие равнозначны — не злоупотребляй одним типом.\n"
+    "- Без ссылок, без призывов подписаться, без «я бот».\n"
+    "- Если уместно, оттолкнись от последнего сообщения в контексте: согласись, оспорь или уточни одной фразой.\n"
+    "- Иногда допустимо мягко не согласиться с предыдущим сообщением, если это уместно.\n"
+    "- Не обязательно поддерживать общий тон беседы — допускается лёгкий контраст или альтернативная точка зрения.\n"
+    "- Пунктуация: естественная. Не обязательно всегда ставить точку в конце. Запятые — где уместно, можно опускать. Никогда не используй длинное тире (—).\n"
+)
+_COMMON_RULES_EMOTIONAL = (
+    _COMMON_RULES_BASE
+    + "- Допустима более резкая или эмоциональная формулировка, если это уместно.\n"
+)
+
+# Формат JSON-ответа с реакцией (P2); дыры заполняются через format_map
+_REACTION_JSON_BLOCK_TMPL = (
+    "\n\nФОРМАТ ОТВЕТА — строго JSON:\n"
+    '{{"reply_text":"...","reaction_emoji":"👍"}}\n'
+    'или {{"reply_text":"...","reaction_emoji":null}}\n'
+    "- reply_text: 1–2 предложения по правилам выше, без эмодзи в тексте.\n"
+    "- reaction_emoji: null примерно в {null_pct}% случаев; иначе ОДИН эмодзи ТОЛЬКО из списка: {allowed}\n"
+    "- НЕ добавляй эмодзи в reply_text — они передаются отдельно.\n"
+    "- Если сообщение токсичное/конфликтное — предпочитай нейтральные (🤔/😅), избегай 🔥.\n"
+)
+
+# Пресеты манеры ответа (веса: сумма 100; ультра-короткий 15%)
+_PRESETS: tuple[str, ...] = (
+    "Формат: одно короткое предложение. Чётко займи позицию: согласие или сомнение.",
+    "Формат: 1–2 предложения. Добавь уточнение или нюанс: можно начать с «Тут есть нюанс», «Не совсем так», «Я бы уточнил» — затем кратко поясни. Без жёсткого конфликта.",
+    "Формат: два предложения. Реагируй на сообщение и приведи один конкретный пример или последствие.",
+    "Формат: 1–2 предложения. В конце задай короткий встречный вопрос по теме сообщения.",
+    "Формат: ультра-короткая реплика — 5–10 слов. Живая реакция без пересказа и аналитики. По тону в духе: сомнение («Сомневаюсь, если честно»), удивление («Ну это звучит странно»), неясность («Как-то всё мутно»), скепсис («Не выглядит убедительно»). Без эмодзи, без вопроса по умолчанию, без «Это может».",
+    "Формат: 1–2 предложения. Начни с мягкого несогласия или сомнения: «Не совсем согласен…», «Я бы поспорил…», «Не уверен, что всё так просто…», «Тут есть другой момент…» — затем одно короткое пояснение или один нюанс. Без агрессии, без морализаторства, без «Это может».",
+)
+_PRESET_WEIGHTS = (22, 20, 18, 10, 15, 15)  # 1 позиция 22%; 2 нюанс 20%; 3 пример 18%; 4 вопрос 10%; 5 ультра 15%; 6 мягк.несогл. 15%
+_PRESET_CUM_WEIGHTS: tuple[int, ...] = tuple(accumulate(_PRESET_WEIGHTS))
+_PRESET_TOTAL_WEIGHT = _PRESET_CUM_WEIGHTS[-1]
+assert len(_PRESET_CUM_WEIGHTS) == len(_PRESETS)
+
+# Границы запросов: таймаут клиента и потолки выходных токенов по типу вызова
+OPENAI_TIMEOUT_SECONDS = 30.0
+OPENAI_IMAGE_TIMEOUT_SECONDS = 120.0  # генерация изображения заметно дольше текста
+MAX_OUTPUT_TOKENS_PARAPHRASE = 2048
+MAX_OUTPUT_TOKENS_SELECT = 512
+MAX_OUTPUT_TOKENS_DISCUSSION = 1024
+MAX_OUTPUT_TOKENS_USER_REPLY = 512
+MAX_OUTPUT_TOKENS_VISION = 128
+
+# Собственный генератор модуля: выборки для промптов не делят состояние глобального random
+_RNG = random.Random()
+
 T = TypeVar("T")
 
 
+def _first_json_object(text: str) -> str | None:
+    """Return the first top-level JSON object in text (fences and chatter cut off)."""
+    start = text.find("{")
+    if start < 0:
+        return None
+    depth = 0
+    in_string = escaped = False
+    for pos in range(start, len(text)):
+        ch = text[pos]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start : pos + 1]
+    return None
+
+
+class LLMCache:
+    """In-memory LRU cache of OpenAI results keyed by a content hash, with TTL."""
+
+    def __init__(self, maxsize: int, ttl_seconds: float) -> None:
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+# Кэш точных совпадений (репосты, перезапуски): общий для всех клиентов процесса.
+LLM_CACHE_TTL_SECONDS = 7 * 24 * 3600
+_TEXT_CACHE = LLMCache(maxsize=512, ttl_seconds=LLM_CACHE_TTL_SECONDS)
+_IMAGE_CACHE = LLMCache(maxsize=16, ttl_seconds=LLM_CACHE_TTL_SECONDS)  # ~1–2 МБ на картинку
+
+
+def _log_cache_hit(kind: str, cache: LLMCache) -> None:
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "openai_cache hit kind=%s hits=%d misses=%d", kind, cache.hits, cache.misses
+        )
+
+
+class RateLimiter:
+    """Adaptive token bucket for an OpenAI TPM/RPM budget; a zero limit disables that dimension.
+
+    The refill rate is scaled down multiplicatively on 429/5xx and recovers additively
+    on success (AIMD). A 429 Retry-After pauses every caller sharing the bucket, even
+    when no TPM/RPM limits are configured.
+    """
+
+    MIN_RATE_SCALE = 0.1
+    DECREASE_FACTOR = 0.5
+    INCREASE_STEP = 0.05
+
+    def __init__(self, tokens_per_minute: int, requests_per_minute: int) -> None:
+        self.tokens_per_minute = max(0, tokens_per_minute)
+        self.requests_per_minute = max(0, requests_per_minute)
+        self.rate_scale = 1.0
+        self._tokens = float(self.tokens_per_minute)
+        self._requests = float(self.requests_per_minute)
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.tokens_per_minute or self.requests_per_minute)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = (now - self._updated_at) * self.rate_scale
+        self._updated_at = now
+        if self.tokens_per_minute:
+            self._tokens = min(
+                float(self.tokens_per_minute),
+                self._tokens + elapsed * self.tokens_per_minute / 60.0,
+            )
+        if self.requests_per_minute:
+            self._requests = min(
+                float(self.requests_per_minute),
+                self._requests + elapsed * self.requests_per_minute / 60.0,
+            )
+
+    async def acquire(self, estimated_tokens: int) -> None:
+        """Wait until one request and estimated_tokens fit into the budget."""
+        blocked_for = self._blocked_until - time.monotonic()
+        if blocked_for > 0:
+            await asyncio.sleep(blocked_for)
+        if not self.enabled:
+            return
+        if self.tokens_per_minute:
+            estimated_tokens = min(estimated_tokens, self.tokens_per_minute)
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = 0.0
+                if self.tokens_per_minute and self._tokens < estimated_tokens:
+                    wait = (estimated_tokens - self._tokens) * 60.0 / self.tokens_per_minute
+                if self.requests_per_minute and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60.0 / self.requests_per_minute)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait / self.rate_scale)
+            self._tokens -= estimated_tokens
+            self._requests -= 1
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Correct the bucket by the difference between estimate and reported usage."""
+        if self.tokens_per_minute and actual_tokens:
+            self._tokens -= actual_tokens - estimated_tokens
+
+    def on_success(self) -> None:
+        if self.rate_scale < 1.0:
+            self.rate_scale = min(1.0, self.rate_scale + self.INCREASE_STEP)
+
+    def on_congestion(self, retry_after: float | None = None) -> None:
+        """Back off after a 429/5xx; retry_after (429) pauses all callers of this bucket."""
+        self.rate_scale = max(self.MIN_RATE_SCALE, self.rate_scale * self.DECREASE_FACTOR)
+        self._tokens = min(self._tokens, 0.0)
+        self._requests = min(self._requests, 0.0)
+        if retry_after:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+
+
+# Общий бюджет на API-ключ: все клиенты (аккаунты) с одним ключом делят лимиты.
+_RATE_LIMITS = (0, 0)
+_RATE_LIMITERS: dict[str, RateLimiter] = {}
+
+
+def configure_rate_limits(tokens_per_minute: int, requests_per_minute: int) -> None:
+    """Set TPM/RPM budgets for limiters created after this call (0 = unlimited)."""
+    global _RATE_LIMITS
+    _RATE_LIMITS = (tokens_per_minute, requests_per_minute)
+    _RATE_LIMITERS.clear()
+
+
+def _get_rate_limiter(api_key: str) -> RateLimiter:
+    limiter = _RATE_LIMITERS.get(api_key)
+    if limiter is None:
+        limiter = RateLimiter(*_RATE_LIMITS)
+        _RATE_LIMITERS[api_key] = limiter
+    return limiter
+
+
+def _estimate_tokens(*texts: str) -> int:
+    # Грубая оценка ~4 символа на токен; расхождение поправляет record_usage.
+    return sum(len(text) for text in texts) // 4 + 1
+
+
+# Один пул соединений на процесс: аккаунты не плодят сокеты и TLS-рукопожатия.
+_HTTP_LIMITS = httpx.Limits(
+    max_connections=200, max_keepalive_connections=100, keepalive_expiry=60
+)
+_SHARED_HTTP_CLIENT: httpx.AsyncClient | None = None
+_ASYNC_CLIENTS: dict[str, AsyncOpenAI] = {}
+
+
+def _shared_http_client() -> httpx.AsyncClient:
+    """Process-wide HTTP client: aiohttp transport when available, httpx otherwise."""
+    global _SHARED_HTTP_CLIENT
+    if _SHARED_HTTP_CLIENT is None:
+        if DefaultAioHttpClient is not None:
+            try:
+                _SHARED_HTTP_CLIENT = DefaultAioHttpClient(limits=_HTTP_LIMITS)
+            except Exception:  # noqa: BLE001 - extra installed без aiohttp
+                logger.warning("aiohttp transport unavailable, using default httpx client")
+        if _SHARED_HTTP_CLIENT is None:
+            _SHARED_HTTP_CLIENT = DefaultAsyncHttpxClient(limits=_HTTP_LIMITS)
+    return _SHARED_HTTP_CLIENT
+
+
+def _get_async_client(api_key: str) -> AsyncOpenAI:
+    """One AsyncOpenAI per API key, all sharing the process-wide connection pool."""
+    client = _ASYNC_CLIENTS.get(api_key)
+    if client is None:
+        client = AsyncOpenAI(
+            api_key=api_key,
+            timeout=OPENAI_TIMEOUT_SECONDS,
+            max_retries=0,  # повторы делает _with_retries
+            http_client=_shared_http_client(),
+        )
+        _ASYNC_CLIENTS[api_key] = client
+    return client
+
+
 class OpenAIClient:
-    """Wrapper around OpenAI SDK with retry logic for key operations."""
+    """Async wrapper around OpenAI SDK with retry logic for key operations."""
 
     def __init__(
         self,
@@ -106,37 +461,75 @@ class OpenAIClient:
     ) -> None:
         if not system_prompt.strip():
             raise ValueError("System prompt is empty")
-        self.client = OpenAI(api_key=api_key)
+        self.client = _get_async_client(api_key)
+        self.rate_limiter = _get_rate_limiter(api_key)
         self.system_prompt = system_prompt
         self.text_model = text_model or "gpt-4.1-mini"
         self.vision_model = vision_model or "gpt-4.1-mini"
         self.image_model = image_model or "gpt-image-1"
 
-    def paraphrase_news(self, text: str) -> Tuple[str, int, int, int]:
-        """Paraphrase a news text in Russian with a neutral style."""
-        return self._with_retries(
-            lambda: self._responses_text(self.system_prompt, text)
+    async def paraphrase_news(self, text: str) -> Tuple[str, int, int, int]:
+        """Paraphrase a news text in Russian with a neutral style.
+
+        Exact repeats are served from cache and report zero tokens (nothing was billed).
+        """
+        key = LLMCache.make_key("paraphrase", self.text_model, self.system_prompt, text)
+        cached = _TEXT_CACHE.get(key)
+        if cached is not None:
+            _log_cache_hit("paraphrase", _TEXT_CACHE)
+            return cached, 0, 0, 0
+        result = await self._with_retries(
+            lambda: self._responses_text(
+                self.system_prompt, text, max_output_tokens=MAX_OUTPUT_TOKENS_PARAPHRASE
+            )
         )
+        _TEXT_CACHE.set(key, result[0])
+        return result
+
+    async def describe_image_for_news(self, image: bytes | str) -> str:
+        """Describe the image in a short neutral news style.
 
-    def describe_image_for_news(self, image_bytes: bytes) -> str:
-        """Describe the image in a short neutral news style."""
+        Accepts raw image bytes or an already base64-encoded string.
+        """
         prompt = (
             "Кратко опиши изображение (1–2 предложения) в нейтральном "
             "новостном стиле."
         )
-        return self._with_retries(lambda: self._responses_vision(prompt, image_bytes))
-
-    def generate_image_from_description(self, description: str) -> Tuple[bytes, int]:
-        """Generate a neutral news illustration image from a description."""
+        # Кодируем один раз до ретраев: повторные попытки переиспользуют data URL.
+        image_b64 = image if isinstance(image, str) else b64encode(image).decode("ascii")
+        key = LLMCache.make_key("vision", self.vision_model, prompt, image_b64)
+        cached = _TEXT_CACHE.get(key)
+        if cached is not None:
+            _log_cache_hit("vision", _TEXT_CACHE)
+            return cached
+        image_url = "data:image/png;base64," + image_b64
+        description = await self._with_retries(lambda: self._responses_vision(prompt, image_url))
+        _TEXT_CACHE.set(key, description)
+        return description
+
+    async def generate_image_from_description(
+        self, description: str
+    ) -> Tuple[bytes, int, bool]:
+        """Generate a neutral news illustration image from a description.
+
+        Returns (image_bytes, image_tokens, cache_hit); a cache hit costs nothing.
+        """
         prompt = (
             "Сгенерируй нейтральную новостную иллюстрацию по описанию. "
             "Без логотипов, без текста на изображении, без копирования "
             "уникального дизайна. Описание: "
             f"{description}"
         )
-        return self._with_retries(lambda: self._generate_image(prompt))
-
-    def select_discussion_news(
+        key = LLMCache.make_key("image", self.image_model, prompt)
+        cached = _IMAGE_CACHE.get(key)
+        if cached is not None:
+            _log_cache_hit("image", _IMAGE_CACHE)
+            return cached, 0, True
+        image_bytes, image_tokens = await self._with_retries(lambda: self._generate_image(prompt))
+        _IMAGE_CACHE.set(key, image_bytes)
+        return image_bytes, image_tokens, False
+
+    async def select_discussion_news(
         self,
         candidates: list[str],
         *,
@@ -150,7 +543,7 @@ class OpenAIClient:
         if not candidates:
             raise ValueError("Candidates list is empty")
         enumerated = "\n".join(
-            f"{idx + 1}. {text}" for idx, text in enumerate(candidates)
+            ["%d. %s" % item for item in enumerate(candidates, 1)]
         )
         avoid_hint = ""
         if recent_topics:
@@ -166,8 +559,10 @@ class OpenAIClient:
             f"{avoid_hint}\n"
             f"{enumerated}"
         )
-        text, in_tokens, out_tokens, total_tokens = self._with_retries(
-            lambda: self._responses_text(self.system_prompt, prompt)
+        text, in_tokens, out_tokens, total_tokens = await self._with_retries(
+            lambda: self._responses_text(
+                self.system_prompt, prompt, max_output_tokens=MAX_OUTPUT_TOKENS_SELECT
+            )
         )
         _log_openai_usage(
             kind="discussion_select",
@@ -177,10 +572,10 @@ class OpenAIClient:
             input_tokens=in_tokens,
             output_tokens=out_tokens,
             total_tokens=total_tokens,
-            extra=extra or {},
+            extra=extra or _EMPTY_EXTRA,
         )
         try:
-            data = json.loads(text)
+            data = json_loads(_first_json_object(text) or text)
             index = int(data.get("index"))
         except Exception as exc:
             raise RuntimeError("OpenAI returned invalid JSON for selection") from exc
@@ -188,7 +583,7 @@ class OpenAIClient:
             raise RuntimeError("OpenAI returned out-of-range index")
         return index, in_tokens, out_tokens, total_tokens
 
-    def generate_discussion_messages(
+    async def generate_discussion_messages(
         self,
         news_text: str,
         replies_count: int,
@@ -201,12 +596,7 @@ class OpenAIClient:
     ) -> Tuple[dict, int, int, int]:
         """Generate question and replies for discussion."""
         # Persona is presentation-only and must not affect decision logic.
-        roles_text = "\n".join(f"- {role}" for role in roles) or "- userbot"
-        # Таксономия: подбирай тип вопроса по смыслу новости (конфликт/геополитика, товары/цены, природа/здоровье, культура/медиа, экономика/общество)
-        taxonomy_lines = []
-        for group_name, questions in ADMIN_QUESTION_TAXONOMY.items():
-            taxonomy_lines.append(f"- {group_name}: " + " | ".join(questions))
-        taxonomy_block = "Типы вопросов по смыслу новости (выбери группу и один из вариантов или свой в том же духе):\n" + "\n".join(taxonomy_lines)
+        roles_text = _roles_text(tuple(roles))
         avoid_block = ""
         if last_questions:
             avoid_block = (
@@ -214,49 +604,21 @@ class OpenAIClient:
                 + " | ".join(f"«{q[:60]}{'…' if len(q) > 60 else ''}»" for q in last_questions[:5])
                 + "\n\n"
             )
-        question_variety_hint = (
-            "Вопрос ведущего (поле question) обязательно должен состоять из двух частей: (1) кратко суть новости (1–2 предложения), "
-            "чтобы в чате было понятно, о чём речь; (2) вопрос к аудитории. "
-            "Подбирай формулировку под смысл: для конфликтов/инцидентов — «кто за этим?», «кому выгодно?»; "
-            "для товаров/цен — «вы бы купили?», «какая у вас машина?»; "
-            "для природы/здоровья — «готовы ли к такому?», «как повлияет на вас?»; "
-            "для культуры/трендов — «как вам история?», «согласны с развитием?». "
-            "Нельзя выводить в question только короткую фразу без контекста.\n\n"
-            + taxonomy_block
-            + avoid_block
-            + "\n"
-        )
         prompt = (
-            "Сгенерируй живое обсуждение новости для Telegram-чата.\n"
-            "Верни JSON строго вида:\n"
-            "{\"question\": \"...\", \"replies\": [\"...\", ...]}\n\n"
-
-            f"Количество ответов: {replies_count}\n\n"
-
-            + question_variety_hint
-            + "Требования к стилю:\n"
-            "- В question всегда сначала изложи суть новости, затем задай вопрос к чату. Короткий вопрос без контекста (только «Как вы это восприняли?» и т.п.) запрещён.\n"
-            "- Диалог должен выглядеть как реальная беседа людей, а не как ответы на экзамене.\n"
-            "- Не использовать формулировки типа: «Это может», «Это может привести», «Это может повлиять».\n"
-            "- Избегать канцелярита и журналистского стиля.\n"
-            "- Ответы должны различаться по длине.\n"
-            "- Допускается лёгкое несогласие между участниками.\n"
-            "- Можно реагировать на предыдущие ответы (соглашаться, спорить, уточнять).\n"
-            "- Не повторять формулировки друг друга.\n"
-            "- Не использовать абстрактные конструкции вроде «общественное восприятие», «социальный эффект», «некоторые могут считать».\n"
-            "- Разнообразь вводные: не все ответы должны начинаться с «Согласна», «Не уверен», «Если честно», «Интересно». Используй разные начала: «Скорее всего», «Тут есть нюанс», «Ну тут спорно», «Логично», «С другой стороны», «Зависит», «Похоже на то», «Вряд ли», «Хм», или начинай сразу по делу.\n"
-            "- Не все участники должны быть аналитиками — допускается бытовой язык.\n"
-            "- Пунктуация: естественная. Не обязательно всегда ставить точку в конце. Запятые — где уместно. Никогда не используй длинное тире (—).\n\n"
-
-            "Роли участников (каждый строго следует своему стилю):\n"
+            f"Количество ответов: {replies_count}\n"
+            + avoid_block
+            + "\nРоли участников (каждый строго следует своему стилю):\n"
             f"{roles_text}\n\n"
-
             "Новость:\n"
             f"{news_text}"
         )
 
-        text, in_tokens, out_tokens, total_tokens = self._with_retries(
-            lambda: self._responses_text(self.system_prompt, prompt)
+        text, in_tokens, out_tokens, total_tokens = await self._with_retries(
+            lambda: self._responses_text(
+                _with_static_rules(self.system_prompt, _DISCUSSION_PROMPT_PREFIX),
+                prompt,
+                max_output_tokens=MAX_OUTPUT_TOKENS_DISCUSSION,
+            )
         )
         _log_openai_usage(
             kind="discussion_qna",
@@ -266,10 +628,10 @@ class OpenAIClient:
             input_tokens=in_tokens,
             output_tokens=out_tokens,
             total_tokens=total_tokens,
-            extra=extra or {},
+            extra=extra or _EMPTY_EXTRA,
         )
         try:
-            data = json.loads(text)
+            data = json_loads(text)
         except Exception as exc:
             raise RuntimeError("OpenAI returned invalid JSON for discussion") from exc
         if not isinstance(data, dict) or "question" not in data or "replies" not in data:
@@ -278,7 +640,7 @@ class OpenAIClient:
             raise RuntimeError("OpenAI replies must be a list")
         return data, in_tokens, out_tokens, total_tokens
 
-    def generate_user_reply(
+    async def generate_user_reply(
         self,
         *,
         source_text: str,
@@ -297,76 +659,27 @@ class OpenAIClient:
         Returns (reply_text, reaction_emoji, in_tokens, out_tokens, total_tokens, gen_info).
         reaction_emoji: str | None — emoji to put on user's message (when model_driven_reaction).
         gen_info: {preset_idx, length_hint, reaction_emoji} for observability."""
-        context_block = "\n".join(
-            f"- {text}" for text in context_messages if text.strip()
-        )
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        parts = [text for text in context_messages if text and text.strip()]
+        context_block = "- " + "\n- ".join(parts) if parts else ""
 
-        if persona_meta is None:
-            logger.warning(
-                "generate_user_reply: persona_meta is None, using defaults (tone=neutral verbosity=short)"
-            )
-        meta = persona_meta or {}
-
-        raw_tone = meta.get("tone", "neutral")
-        tone = raw_tone if raw_tone in VALID_TONES else "neutral"
-        if raw_tone != tone:
-            logger.warning(
-                "generate_user_reply: invalid tone=%r, using default neutral",
-                raw_tone,
-            )
+        tone, verbosity, gender = _normalize_persona_meta(persona_meta)
 
-        raw_verbosity = meta.get("verbosity", "short")
-        verbosity = raw_verbosity if raw_verbosity in VALID_VERBOSITY else "short"
-        if raw_verbosity != verbosity:
-            logger.warning(
-                "generate_user_reply: invalid verbosity=%r, using default short",
-                raw_verbosity,
-            )
-
-        raw_gender = meta.get("gender", "male")
-        gender = raw_gender if raw_gender in VALID_GENDER else "male"
-        if raw_gender != gender:
-            logger.warning(
-                "generate_user_reply: invalid gender=%r, using default male",
-                raw_gender,
-            )
-
-        # Общие правила (всегда в промпте)
-        common_rules_parts = [
-            "Ты участник живого Telegram-чата. Пиши как живой человек, не как эксперт и не как статья.\n\n"
-            "Обязательно:\n"
-            "- Выбери одну фразу или деталь из сообщения пользователя и отвечай именно на неё; не пересказывай весь вопрос.\n"
-            "- Не копируй формулировки пользователя дословно — перефразируй своими словами.\n"
-            "- Не начинай со слов: «Это может», «Это может привести», «Это может повлиять».\n"
-            "- Избегай канцелярита и журналистского тона.\n"
-            "- Иногда отвечай сразу по делу, не всегда с вводных («Скорее всего», «Честно говоря» и т.п.).\n"
-            "- Согласие, сомнение и лёгкое несогласие равнозначны — не злоупотребляй одним типом.\n"
-            "- Без ссылок, без призывов подписаться, без «я бот».\n"
-            "- Если уместно, оттолкнись от последнего сообщения в контексте: согласись, оспорь или уточни одной фразой.\n"
-            "- Иногда допустимо мягко не согласиться с предыдущим сообщением, если это уместно.\n"
-            "- Не обязательно поддерживать общий тон беседы — допускается лёгкий контраст или альтернативная точка зрения.\n"
-            "- Пунктуация: естественная. Не обязательно всегда ставить точку в конце. Запятые — где уместно, можно опускать. Никогда не используй длинное тире (—).\n",
-        ]
-        if tone == "emotional":
-            common_rules_parts.append(
-                "- Допустима более резкая или эмоциональная формулировка, если это уместно.\n"
-            )
-        common_rules = "".join(common_rules_parts)
+        # Общие правила (всегда в system-сообщении, см. _with_static_rules)
+        common_rules = (
+            _COMMON_RULES_EMOTIONAL if tone == "emotional" else _COMMON_RULES_BASE
+        )
 
         # Случайная выборка вводных фраз для вариативности (каждый запрос — разный набор)
-        opening_sample = random.sample(
-            REPLY_OPENING_POOL,
-            min(REPLY_OPENING_SAMPLE_SIZE, len(REPLY_OPENING_POOL)),
-        )
+        opening_sample = _RNG.sample(REPLY_OPENING_POOL, REPLY_OPENING_SAMPLE_SIZE)
         opening_hint = (
             "Варианты начала реплики (выбери один или свой, не повторяй одни и те же подряд): "
-            + ", ".join(f"«{x}»" for x in opening_sample)
+            + ", ".join(["«%s»" % x for x in opening_sample])
             + ". Можно начать сразу по делу без вводной.\n\n"
         )
-        common_rules = common_rules + opening_hint
 
         # Часть 1: микрослучайная длина по verbosity
-        r = random.random()
+        r = _RNG.random()
         if verbosity == "short":
             length_hint = "Длина: одно предложение." if r < 0.7 else "Длина: 1–2 предложения."
         elif verbosity == "medium":
@@ -383,38 +696,25 @@ class OpenAIClient:
 
         # Часть 2: эмоциональный коэффициент (25% для emotional)
         emotional_boost = ""
-        if tone == "emotional" and random.random() < 0.25:
+        if tone == "emotional" and _RNG.random() < 0.25:
             emotional_boost = "\nМожно использовать более живую или резкую интонацию."
 
         # Часть 3: микро-несогласие (20%)
         contrast_hint = ""
-        if random.random() < 0.20:
+        if _RNG.random() < 0.20:
             contrast_hint = "\nМожно занять слегка отличающуюся позицию от предыдущего сообщения, если это логично."
 
-        # Пресеты манеры ответа (веса: сумма 100; ультра-короткий 15%)
-        presets = [
-            "Формат: одно короткое предложение. Чётко займи позицию: согласие или сомнение.",
-            "Формат: 1–2 предложения. Добавь уточнение или нюанс: можно начать с «Тут есть нюанс», «Не совсем так», «Я бы уточнил» — затем кратко поясни. Без жёсткого конфликта.",
-            "Формат: два предложения. Реагируй на сообщение и приведи один конкретный пример или последствие.",
-            "Формат: 1–2 предложения. В конце задай короткий встречный вопрос по теме сообщения.",
-            "Формат: ультра-короткая реплика — 5–10 слов. Живая реакция без пересказа и аналитики. По тону в духе: сомнение («Сомневаюсь, если честно»), удивление («Ну это звучит странно»), неясность («Как-то всё мутно»), скепсис («Не выглядит убедительно»). Без эмодзи, без вопроса по умолчанию, без «Это может».",
-            "Формат: 1–2 предложения. Начни с мягкого несогласия или сомнения: «Не совсем согласен…», «Я бы поспорил…», «Не уверен, что всё так просто…», «Тут есть другой момент…» — затем одно короткое пояснение или один нюанс. Без агрессии, без морализаторства, без «Это может».",
-        ]
-        weights = [22, 20, 18, 10, 15, 15]  # 1 позиция 22%; 2 нюанс 20%; 3 пример 18%; 4 вопрос 10%; 5 ультра 15%; 6 мягк.несогл. 15%
-        preset_idx = random.choices(range(len(presets)), weights=weights, k=1)[0]
-        preset = presets[preset_idx]
+        preset_idx = bisect_right(_PRESET_CUM_WEIGHTS, _RNG.random() * _PRESET_TOTAL_WEIGHT)
+        preset = _PRESETS[preset_idx]
         # Для ультра-короткого пресета (индекс 4) не добавляем length_hint — он уже задан
-        preset_block = f"Сейчас:\n{preset}\n"
-        if preset_idx != 4:
-            preset_block += f"\n{length_hint}\n"
-        preset_block += f"{emotional_boost}{contrast_hint}\n\n"
+        length_block = f"\n{length_hint}\n" if preset_idx != 4 else ""
 
         gen_info: dict[str, Any] = {
             "preset_idx": preset_idx,
             "length_hint": length_hint,
         }
-        if logger.isEnabledFor(logging.DEBUG):
-            account_name = (extra or {}).get("account_name", "?")
+        if debug_enabled:
+            account_name = (extra or _EMPTY_EXTRA).get("account_name", "?")
             logger.debug(
                 "user_reply persona: account=%s tone=%s verbosity=%s gender=%s preset_idx=%s length_hint=%s",
                 account_name,
@@ -427,25 +727,17 @@ class OpenAIClient:
 
         json_block = ""
         if model_driven_reaction and allowed_reactions:
-            allowed_str = json.dumps(allowed_reactions, ensure_ascii=False)
-            null_pct = int(reaction_null_rate * 100)
-            json_block = (
-                "\n\nФОРМАТ ОТВЕТА — строго JSON:\n"
-                '{"reply_text":"...","reaction_emoji":"👍"}\n'
-                'или {"reply_text":"...","reaction_emoji":null}\n'
-                f"- reply_text: 1–2 предложения по правилам выше, без эмодзи в тексте.\n"
-                f"- reaction_emoji: null примерно в {null_pct}% случаев; иначе ОДИН эмодзи ТОЛЬКО из списка: {allowed_str}\n"
-                "- НЕ добавляй эмодзи в reply_text — они передаются отдельно.\n"
-                "- Если сообщение токсичное/конфликтное — предпочитай нейтральные (🤔/😅), избегай 🔥.\n"
+            json_block = _reaction_json_block(
+                int(reaction_null_rate * 100), tuple(allowed_reactions)
             )
-            if logger.isEnabledFor(logging.DEBUG):
+            if debug_enabled:
                 preview = allowed_reactions[:50] if len(allowed_reactions) <= 50 else allowed_reactions[:50] + ["…"]
                 logger.debug("allowed_reactions (first 50): %s", preview)
 
         answer_label = "Ответ (JSON):" if (model_driven_reaction and allowed_reactions) else "Ответ:"
         prompt = (
-            f"{common_rules}"
-            f"{preset_block}"
+            f"{opening_hint}"
+            f"Сейчас:\n{preset}\n{length_block}{emotional_boost}{contrast_hint}\n\n"
             f"Твоя роль в этом чате:\n{role_label}\n\n"
             "Последние сообщения чата:\n"
             f"{context_block}\n\n"
@@ -454,9 +746,14 @@ class OpenAIClient:
             f"{json_block}\n{answer_label}"
         )
 
-        system_for_call = system_prompt_override if system_prompt_override else self.system_prompt
-        raw_text, in_tokens, out_tokens, total_tokens = self._with_retries(
-            lambda: self._responses_text(system_for_call, prompt)
+        system_for_call = _with_static_rules(
+            system_prompt_override if system_prompt_override else self.system_prompt,
+            common_rules,
+        )
+        raw_text, in_tokens, out_tokens, total_tokens = await self._with_retries(
+            lambda: self._responses_text(
+                system_for_call, prompt, max_output_tokens=MAX_OUTPUT_TOKENS_USER_REPLY
+            )
         )
         _log_openai_usage(
             kind="user_reply",
@@ -466,50 +763,55 @@ class OpenAIClient:
             input_tokens=in_tokens,
             output_tokens=out_tokens,
             total_tokens=total_tokens,
-            extra=extra or {},
+            extra=extra or _EMPTY_EXTRA,
         )
 
-        reply_text = raw_text.strip()
+        # _extract_text уже вернул обрезанный текст
+        reply_text = raw_text
         reaction_emoji: Optional[str] = None
         if model_driven_reaction and allowed_reactions:
             try:
-                data = json.loads(reply_text)
-                if isinstance(data, dict):
-                    reply_text = (data.get("reply_text") or "").strip()
-                    raw_emoji = data.get("reaction_emoji")
-                    if raw_emoji is not None and str(raw_emoji).strip():
-                        e = str(raw_emoji).strip()
-                        if e in allowed_reactions:
-                            reaction_emoji = e
-                        else:
-                            if logger.isEnabledFor(logging.DEBUG):
-                                logger.debug("reaction_emoji not in allowed: %r raw_json=%s", e, raw_text[:200])
+                data = json_loads(raw_text)
             except json.JSONDecodeError as exc:
-                if logger.isEnabledFor(logging.DEBUG):
+                if debug_enabled:
                     logger.debug("generate_user_reply JSON parse failed: %s raw=%s", exc, raw_text[:200])
-                reply_text = raw_text.strip()
-                reaction_emoji = None
+                data = None
+            if isinstance(data, dict):
+                reply_text = (data.get("reply_text") or "").strip()
+                raw_emoji = data.get("reaction_emoji")
+                e = str(raw_emoji).strip() if raw_emoji is not None else ""
+                if e:
+                    if e in allowed_reactions:
+                        reaction_emoji = e
+                    elif debug_enabled:
+                        logger.debug("reaction_emoji not in allowed: %r raw_json=%s", e, raw_text[:200])
             gen_info["reaction_emoji"] = reaction_emoji
 
         if not model_driven_reaction or not allowed_reactions:
             return reply_text, None, in_tokens, out_tokens, total_tokens, gen_info
         return reply_text, reaction_emoji, in_tokens, out_tokens, total_tokens, gen_info
 
-    def _responses_text(
-        self, system_prompt: str, user_text: str
+    async def _responses_text(
+        self, system_prompt: str, user_text: str, *, max_output_tokens: int
     ) -> Tuple[str, int, int, int]:
-        response = self.client.responses.create(
+        estimated = _estimate_tokens(system_prompt, user_text) + max_output_tokens
+        await self.rate_limiter.acquire(estimated)
+        response = await self.client.responses.create(
             model=self.text_model,
             input=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_text},
             ],
+            max_output_tokens=max_output_tokens,
         )
-        return self._extract_text_and_tokens(response)
-
-    def _responses_vision(self, prompt: str, image_bytes: bytes) -> str:
-        image_b64 = base64.b64encode(image_bytes).decode("ascii")
-        response = self.client.responses.create(
+        result = self._extract_text_and_tokens(response)
+        self.rate_limiter.record_usage(estimated, result[3])
+        return result
+
+    async def _responses_vision(self, prompt: str, image_url: str) -> str:
+        # Картинка тарифицируется отдельно от base64-строки; берём промпт + потолок вывода.
+        await self.rate_limiter.acquire(_estimate_tokens(prompt) + MAX_OUTPUT_TOKENS_VISION)
+        response = await self.client.responses.create(
             model=self.vision_model,
             input=[
                 {
@@ -518,70 +820,155 @@ class OpenAIClient:
                         {"type": "input_text", "text": prompt},
                         {
                             "type": "input_image",
-                            "image_url": f"data:image/png;base64,{image_b64}",
+                            "image_url": image_url,
                         },
                     ],
                 }
             ],
+            max_output_tokens=MAX_OUTPUT_TOKENS_VISION,
         )
         return self._extract_text(response)
 
-    def _generate_image(self, prompt: str) -> Tuple[bytes, int]:
-        response = self.client.images.generate(
+    async def _generate_image(self, prompt: str) -> Tuple[bytes, int]:
+        await self.rate_limiter.acquire(0)
+        response = await self.client.images.generate(
             model=self.image_model,
             prompt=prompt,
             size="1024x1024",
+            timeout=OPENAI_IMAGE_TIMEOUT_SECONDS,
         )
         image_b64 = response.data[0].b64_json
-        return base64.b64decode(image_b64), 0
+        # bytes отдаём как есть: io.BytesIO(bytes) в send_image_with_caption не копирует
+        # буфер, а memoryview пришлось бы копировать обратно при оборачивании.
+        return a2b_base64(image_b64), 0
 
     def _extract_text(self, response: object) -> str:
-        text = getattr(response, "output_text", None)
-        if isinstance(text, str) and text.strip():
-            return text.strip()
+        try:
+            text = response.output_text
+        except AttributeError:
+            return self._extract_text_slow(response)
+        if text:
+            # str.strip() возвращает тот же объект, если обрезать нечего
+            text = text.strip()
+            if text:
+                return text
+        return self._extract_text_slow(response)
+
+    def _extract_text_slow(self, response: object) -> str:
+        """Walk output items when the aggregated output_text is missing or empty."""
         output = getattr(response, "output", None)
         if output:
             for item in output:
                 content = getattr(item, "content", [])
                 for part in content:
                     part_text = getattr(part, "text", None)
-                    if isinstance(part_text, str) and part_text.strip():
-                        return part_text.strip()
+                    if isinstance(part_text, str):
+                        part_text = part_text.strip()
+                        if part_text:
+                            return part_text
         raise RuntimeError("OpenAI response did not contain text output")
 
     def _extract_text_and_tokens(self, response: object) -> Tuple[str, int, int, int]:
         text = self._extract_text(response)
-        input_tokens = 0
-        output_tokens = 0
-        total_tokens = 0
         usage = getattr(response, "usage", None)
-        if usage:
-            total = getattr(usage, "total_tokens", None)
-            if isinstance(total, int):
-                total_tokens = total
-            input_total = getattr(usage, "input_tokens", None)
-            if isinstance(input_total, int):
-                input_tokens = input_total
-            output_total = getattr(usage, "output_tokens", None)
-            if isinstance(output_total, int):
-                output_tokens = output_total
-        if total_tokens == 0 and (input_tokens or output_tokens):
-            total_tokens = input_tokens + output_tokens
+        if usage is None:
+            return text, 0, 0, 0
+        input_tokens = getattr(usage, "input_tokens", 0) or 0
+        output_tokens = getattr(usage, "output_tokens", 0) or 0
+        total_tokens = getattr(usage, "total_tokens", 0) or (input_tokens + output_tokens)
         return text, input_tokens, output_tokens, total_tokens
 
-    def _with_retries(self, func: Callable[[], T], retries: int = 2) -> T:
+    async def _with_retries(
+        self, func: Callable[[], Awaitable[T]], retries: int = 3
+    ) -> T:
         last_error: Optional[Exception] = None
         for attempt in range(retries + 1):
             try:
-                return func()
-            except Exception as exc:  # noqa: BLE001 - log and retry on any SDK error
+                result = await func()
+            except _RETRYABLE_ERRORS as exc:
                 last_error = exc
-                logger.exception("OpenAI request failed on attempt %s", attempt + 1)
+                logger.warning(
+                    "OpenAI request failed on attempt %s: %s: %s",
+                    attempt + 1,
+                    type(exc).__name__,
+                    exc,
+                )
+                delay = _retry_delay(exc, attempt)
+                if isinstance(exc, RateLimitError):
+                    self.rate_limiter.on_congestion(retry_after=delay)
+                elif isinstance(exc, InternalServerError):
+                    self.rate_limiter.on_congestion()
                 if attempt < retries:
-                    time.sleep(2**attempt)
+                    await asyncio.sleep(delay)
+            else:
+                self.rate_limiter.on_success()
+                return result
         raise RuntimeError("OpenAI request failed after retries") from last_error
 
 
+# Повторяем только временные ошибки; 4xx (кроме 429) и ошибки разбора — сразу наверх.
+_RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+RATE_LIMIT_MIN_WAIT_SECONDS = 10.0
+
+
+def _retry_delay(exc: Exception, attempt: int) -> float:
+    """Retry-After for 429 (at least 10s), exponential backoff with jitter otherwise."""
+    if isinstance(exc, RateLimitError):
+        retry_after = None
+        response = getattr(exc, "response", None)
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+        try:
+            return max(RATE_LIMIT_MIN_WAIT_SECONDS, float(retry_after))
+        except (TypeError, ValueError):
+            return RATE_LIMIT_MIN_WAIT_SECONDS
+    return (2**attempt) + random.uniform(0, 1)
+
+
+@lru_cache(maxsize=64)
+def _reaction_json_block(null_pct: int, allowed_reactions: tuple[str, ...]) -> str:
+    """JSON answer format block; chats reuse the same reaction sets and null rate."""
+    return _REACTION_JSON_BLOCK_TMPL.format_map(
+        {"null_pct": null_pct, "allowed": json_dumps(list(allowed_reactions))}
+    )
+
+
+@lru_cache(maxsize=32)
+def _with_static_rules(system_prompt: str, rules: str) -> str:
+    """System message with the static rules appended; identical text across calls."""
+    return f"{system_prompt}\n\n{rules}"
+
+
+@lru_cache(maxsize=256)
+def _roles_text(roles: tuple[str, ...]) -> str:
+    """Bullet list of discussion roles; the same role sets repeat across chats."""
+    return "\n".join(f"- {role}" for role in roles) or "- userbot"
+
+
+def _normalize_persona_meta(persona_meta: dict[str, Any] | None) -> tuple[str, str, str]:
+    """Return validated (tone, verbosity, gender); warn only about invalid values."""
+    if persona_meta is None:
+        logger.warning(
+            "generate_user_reply: persona_meta is None, using defaults (tone=neutral verbosity=short)"
+        )
+        return _DEFAULT_PERSONA_META
+    tone = persona_meta.get("tone", "neutral")
+    verbosity = persona_meta.get("verbosity", "short")
+    gender = persona_meta.get("gender", "male")
+    if tone in VALID_TONES and verbosity in VALID_VERBOSITY and gender in VALID_GENDER:
+        return tone, verbosity, gender
+    if tone not in VALID_TONES:
+        logger.warning("generate_user_reply: invalid tone=%r, using default neutral", tone)
+        tone = "neutral"
+    if verbosity not in VALID_VERBOSITY:
+        logger.warning("generate_user_reply: invalid verbosity=%r, using default short", verbosity)
+        verbosity = "short"
+    if gender not in VALID_GENDER:
+        logger.warning("generate_user_reply: invalid gender=%r, using default male", gender)
+        gender = "male"
+    return tone, verbosity, gender
+
+
 def _log_openai_usage(
     *,
     kind: str,
@@ -591,7 +978,7 @@ def _log_openai_usage(
     input_tokens: int,
     output_tokens: int,
     total_tokens: int,
-    extra: dict[str, Any],
+    extra: Mapping[str, Any],
 ) -> None:
     if input_tokens == 0 and output_tokens == 0 and total_tokens == 0:
         logger.warning(
@@ -600,9 +987,11 @@ def _log_openai_usage(
             model,
             pipeline_id,
             chat_id,
-            extra,
+            extra or "{}",
         )
         return
+    if not logger.isEnabledFor(logging.INFO):
+        return
     logger.info(
         "openai_usage kind=%s model=%s pipeline=%s chat=%s input=%d output=%d total=%d extra=%s",
         kind,
@@ -612,5 +1001,5 @@ def _log_openai_usage(
         input_tokens,
         output_tokens,
         total_tokens,
-        extra,
+        extra or "{}",
     )
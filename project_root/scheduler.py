@@ -9,20 +9,30 @@ import logging
 import os
 import random
 import re
-from collections import namedtuple
-from datetime import datetime, timedelta, timezone
+import time
+from collections import OrderedDict, deque, namedtuple
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from itertools import islice
 from zoneinfo import ZoneInfo
-from typing import Any, List
+from typing import Any, List, Sequence
 
 # Candidate post from channel with Telegram message_id (P0: no search by text)
 PostCandidate = namedtuple("PostCandidate", ["message_id", "text", "created_at"])
 
-from sqlalchemy import delete, select
+from sqlalchemy import case, delete, insert, select
 from sqlalchemy.orm import Session
 from rank_bm25 import BM25Okapi
 
+try:  # C-автомат Aho–Corasick для ключевых слов реакций; без него — подстрочный поиск
+    import ahocorasick
+except ImportError:  # pragma: no cover - pyahocorasick не установлен
+    ahocorasick = None
+
 from project_root.config import Config
 from project_root.db import (
+    create_discussion_replies,
     create_discussion_reply,
     get_all_pipelines,
     get_chat_state,
@@ -32,15 +42,17 @@ from project_root.db import (
     get_pipeline_sources,
     get_pipeline_state,
     get_session,
-    get_userbot_persona,
+    get_userbot_persona_cached,
     list_discussion_bot_weights,
     list_due_discussion_replies,
-    mark_discussion_reply_cancelled,
-    mark_discussion_reply_sent,
+    mark_discussion_replies_cancelled,
+    mark_discussion_replies_sent,
+    naive_utc,
     upsert_discussion_bot_weight,
 )
 from project_root.pipeline_status import set_status as _set_pipeline_status
 from project_root.topics import extract_topics_for_text
+from project_root.utils import json_dumps, json_loads
 from project_root.models import (
     ChatState,
     DiscussionBotWeight,
@@ -85,20 +97,108 @@ PERSONA_PROFILE_OVERRIDES: dict[str, dict[str, str]] = {
     "t9083516765": {"display_name": "Николай Лебедев", "gender": "male"},
 }
 
-# In-memory reaction throttling (Pipeline 1 channel). Resets on process restart.
-_REACTION_LAST_AT: dict[tuple[str, str], datetime] = {}  # (account_name, chat_id)
-_REACTION_TODAY: dict[tuple[str, str, str], int] = {}  # (account_name, chat_id, date_str)
-# (chat_id, message_id) -> count: reactions placed on this post today
-_REACTION_POST_REACT_COUNT: dict[tuple[str, int], int] = {}
-# (chat_id, message_id, account_name) -> date_iso: bot already reacted to this post today
-_REACTION_POST_REACTED_BY: dict[tuple[str, int, str], str] = {}
-_REACTION_DAY: str | None = None  # YYYY-MM-DD for daily reset
 
-# In-memory chat reaction throttling (Pipeline 2). Resets on process restart.
-_CHAT_REACTION_LAST_AT: dict[tuple[str, str], datetime] = {}
-_CHAT_REACTION_TODAY: dict[tuple[str, str, str], int] = {}
-_CHAT_REACTION_REACTED_TODAY: dict[tuple[str, int], str] = {}
-_CHAT_REACTION_DAY: str | None = None
+@dataclass(frozen=True, slots=True)
+class _ReactionSettings:
+    """Reaction knobs read from Config once (emoji lists parsed once too)."""
+
+    enabled: bool
+    probability: float
+    cooldown_minutes: int
+    daily_limit: int
+    max_per_post: int
+    use_allowed: bool
+    sample_limit: int
+    min_bots: int
+    emojis: tuple[str, ...]
+    chat_enabled: bool
+    chat_model_driven: bool
+    chat_on_user_message: bool
+    chat_probability: float
+    chat_cooldown_minutes: int
+    chat_daily_limit: int
+    chat_emojis: tuple[str, ...]
+
+
+_REACTION_SETTINGS: tuple[Config, _ReactionSettings] | None = None
+
+
+def _reaction_settings(config: Config) -> _ReactionSettings:
+    """Reaction settings for config, built on first use and reused afterwards."""
+    global _REACTION_SETTINGS
+    cached = _REACTION_SETTINGS
+    if cached is not None and cached[0] is config:
+        return cached[1]
+    settings = _ReactionSettings(
+        enabled=getattr(config, "REACTIONS_ENABLED", False),
+        probability=config.REACTION_PROBABILITY,
+        cooldown_minutes=getattr(config, "REACTION_COOLDOWN_MINUTES", 30),
+        daily_limit=getattr(config, "REACTION_DAILY_LIMIT_PER_BOT", 10),
+        max_per_post=getattr(config, "REACTION_MAX_REACTIONS_PER_POST_PER_DAY", 1),
+        use_allowed=getattr(config, "REACTION_USE_ALLOWED_FROM_TELEGRAM", True),
+        sample_limit=getattr(config, "REACTION_ALLOWED_SAMPLE_LIMIT", 80),
+        min_bots=getattr(config, "REACTION_MIN_BOTS_PER_POST", 1),
+        emojis=tuple(config.reaction_emojis_list()),
+        chat_enabled=getattr(config, "CHAT_REACTIONS_ENABLED", False),
+        chat_model_driven=getattr(config, "CHAT_REACTIONS_MODEL_DRIVEN", False),
+        chat_on_user_message=getattr(config, "CHAT_REACTION_ON_USER_MESSAGE", True),
+        chat_probability=getattr(config, "CHAT_REACTION_PROBABILITY", 0.15),
+        chat_cooldown_minutes=getattr(config, "CHAT_REACTION_COOLDOWN_MINUTES", 10),
+        chat_daily_limit=getattr(config, "CHAT_REACTION_DAILY_LIMIT_PER_BOT", 20),
+        chat_emojis=tuple(config.chat_reaction_emojis_list()),
+    )
+    _REACTION_SETTINGS = (config, settings)
+    return settings
+
+
+@dataclass(slots=True)
+class _ReactionLedger:
+    """In-memory reaction throttling. Resets on process restart; daily part on date change."""
+
+    # (account_name, chat_id) -> time.monotonic() of the last reaction
+    last_at: dict[tuple[str, str], float] = field(default_factory=dict)
+    day: int | None = None  # date ordinal the daily part belongs to
+    bot_counts: dict[tuple[str, str], int] = field(default_factory=dict)  # (account_name, chat_id)
+    post_counts: dict[tuple[str, int], int] = field(default_factory=dict)  # (chat_id, message_id)
+    # Pipeline 1: (chat_id, message_id, account_name); Pipeline 2: (chat_id, message_id)
+    reacted: set[tuple] = field(default_factory=set)
+
+    def roll_day(self, now: datetime) -> None:
+        """Start a fresh daily part when the date changes (no restart)."""
+        today = now.toordinal()
+        if self.day == today:
+            return
+        if self.day is not None:
+            # Новые контейнеры вместо clear(): ключи дня больше не нужны
+            self.bot_counts = {}
+            self.post_counts = {}
+            self.reacted = set()
+        self.day = today
+
+    def within_limits(
+        self, account_name: str, chat_id: str, cooldown_cutoff: float, daily_limit: int
+    ) -> bool:
+        """Bot is past its cooldown (last reaction before cutoff) and under the daily limit."""
+        last_at = self.last_at.get((account_name, chat_id))
+        if last_at is not None and last_at > cooldown_cutoff:
+            return False
+        return self.bot_counts.get((account_name, chat_id), 0) < daily_limit
+
+    def record(self, account_name: str, chat_id: str) -> None:
+        """Update cooldown and daily count after a successful reaction."""
+        key = (account_name, chat_id)
+        self.last_at[key] = time.monotonic()
+        self.bot_counts[key] = self.bot_counts.get(key, 0) + 1
+
+
+_CHANNEL_REACTIONS = _ReactionLedger()  # Pipeline 1: reactions on channel posts
+_CHAT_REACTIONS = _ReactionLedger()  # Pipeline 2: reactions on chat messages
+
+# Последняя посчитанная строка дня: strftime на каждом вызове заметен в циклах по ботам.
+_DAY_KEY_CACHE: tuple[date, str] | None = None
+
+# pipeline_id -> (ids постов окна, индекс BM25): окно меняется только после новой публикации.
+_BM25_INDEX_CACHE: dict[int, tuple[tuple[int, ...], BM25Okapi]] = {}
 
 
 # Keywords that suggest sensitive content (conflict/tragedy) — avoid 🔥 😎 😂
@@ -128,6 +228,42 @@ _REACTION_BORING_KEYWORDS = frozenset(
         "скучно", "опять", "рутина", "в сотый раз", "как всегда", "как обычно",
     ]
 )
+# Категории в порядке приоритета: sensitive > scandal > sport > boring
+_REACTION_KEYWORD_CATEGORIES = (
+    ("sensitive", _REACTION_SENSITIVE_KEYWORDS),
+    ("scandal", _REACTION_SCANDAL_KEYWORDS),
+    ("sport", _REACTION_SPORT_KEYWORDS),
+    ("boring", _REACTION_BORING_KEYWORDS),
+)
+
+
+def _build_reaction_automaton():
+    """Aho–Corasick over all reaction keywords: one pass over the text finds every category."""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for category, keywords in _REACTION_KEYWORD_CATEGORIES:
+        for keyword in keywords:
+            automaton.add_word(keyword, automaton.get(keyword, ()) + (category,))
+    automaton.make_automaton()
+    return automaton
+
+
+_REACTION_AUTOMATON = _build_reaction_automaton()
+
+
+def _reaction_keyword_categories(norm: str) -> set[str]:
+    if _REACTION_AUTOMATON is not None:
+        return {
+            category
+            for _, categories in _REACTION_AUTOMATON.iter(norm)
+            for category in categories
+        }
+    return {
+        category
+        for category, keywords in _REACTION_KEYWORD_CATEGORIES
+        if any(kw in norm for kw in keywords)
+    }
 
 # P1/P2: Gender grammar fix (male/female forms).
 from project_root.grammar_fix import fix_gender_grammar
@@ -198,29 +334,34 @@ async def _backfill_post_history_from_channel(
     min_text_length: int,
     window_size: int,
 ) -> int:
-    existing_texts = set(
-        session.execute(
-            select(PostHistory.text)
-            .where(PostHistory.pipeline_id == pipeline_id)
-            .order_by(PostHistory.id.desc())
-            .limit(window_size)
+    # Сравниваем 64-битные хэши, а не тексты; текст читаем только для старых строк без text_hash
+    rows = session.execute(
+        select(
+            PostHistory.text_hash,
+            case((PostHistory.text_hash.is_(None), PostHistory.text)),
         )
-        .scalars()
-        .all()
+        .where(PostHistory.pipeline_id == pipeline_id)
+        .order_by(PostHistory.id.desc())
+        .limit(window_size)
+        .execution_options(yield_per=256)
     )
+    # Множество строим по мере чтения курсора, без промежуточного списка строк
+    existing_hashes = {
+        text_hash if text_hash is not None else _post_text_hash(legacy_text or "")
+        for text_hash, legacy_text in rows
+    }
     messages = []
     async for message in client.iter_messages(source_channel, limit=window_size * 2):
         text = (message.message or "").strip()
         if len(text) < min_text_length:
             continue
-        if text in existing_texts:
+        if _post_text_hash(text) in existing_hashes:
             continue
         messages.append(text)
     if not messages:
         return 0
     # Store oldest first so ordering matches channel recency.
-    for text in reversed(messages):
-        _store_recent_post(session, pipeline_id, text, window_size)
+    _store_recent_posts(session, pipeline_id, list(reversed(messages)), window_size)
     return len(messages)
 
 
@@ -261,14 +402,35 @@ async def _resolve_post_message_id(client, channel: str, text: str, limit: int =
     return None
 
 
-def _pick_reaction_emoji(text: str, emojis: list[str]) -> tuple[str, bool]:
+def _pick_reaction_emoji(text: str, emojis: Sequence[str]) -> tuple[str, bool]:
     """Pick emoji for reaction. Avoid 🔥 for sensitive content. Returns (emoji, sensitive)."""
     emoji, meta = _pick_reaction_emoji_from_candidates(text, emojis)
     return (emoji, meta.get("sensitive", False))
 
 
+# Предпочтения по категориям новости; пересечение с доступными эмодзи считается один раз на набор
+_EMOJI_RULE_PREFS = (
+    ("sensitive", ("🤔", "👀", "✅")),
+    ("scandal", ("⚡", "👀", "🤔")),
+    ("sport", ("✅", "🔥", "😎")),
+    ("boring", ("🥱",)),
+)
+_EMOJI_SENSITIVE_AVOID = frozenset({"🔥", "😎", "😂"})
+
+
+@lru_cache(maxsize=64)
+def _emoji_rule_table(candidates: tuple[str, ...]) -> dict[str, tuple[str, ...]]:
+    """Per-rule preferred emojis available in candidates, plus "safe" (no 🔥 😎 😂)."""
+    available = set(candidates)
+    table = {
+        rule: tuple(e for e in prefer if e in available) for rule, prefer in _EMOJI_RULE_PREFS
+    }
+    table["safe"] = tuple(e for e in candidates if e not in _EMOJI_SENSITIVE_AVOID)
+    return table
+
+
 def _pick_reaction_emoji_from_candidates(
-    text: str, candidates: list[str]
+    text: str, candidates: Sequence[str]
 ) -> tuple[str, dict]:
     """Rule-based emoji pick for Pipeline 1. Returns (emoji, meta) with meta={sensitive, rule}."""
     if not candidates:
@@ -276,118 +438,75 @@ def _pick_reaction_emoji_from_candidates(
     norm = (text or "").strip().lower()
     if not norm:
         return (random.choice(candidates), {"sensitive": False, "rule": "random"})
-    candidates_set = set(candidates)
+    categories = _reaction_keyword_categories(norm)
+    if not categories:
+        return (random.choice(candidates), {"sensitive": False, "rule": "random"})
+    table = _emoji_rule_table(tuple(candidates))
 
     # Sensitive: avoid 🔥 😎 😂, prefer 🤔 👀 ✅
-    if any(kw in norm for kw in _REACTION_SENSITIVE_KEYWORDS):
-        prefer = [e for e in ["🤔", "👀", "✅"] if e in candidates_set]
-        avoid = {"🔥", "😎", "😂"}
-        safe = [e for e in candidates if e not in avoid]
+    if "sensitive" in categories:
+        prefer = table["sensitive"]
+        safe = table["safe"]
         pick = random.choice(prefer) if prefer else (random.choice(safe) if safe else candidates[0])
         return (pick, {"sensitive": True, "rule": "sensitive"})
 
     # Scandal/exposé: prefer ⚡ 👀 🤔
-    if any(kw in norm for kw in _REACTION_SCANDAL_KEYWORDS):
-        prefer = [e for e in ["⚡", "👀", "🤔"] if e in candidates_set]
-        if prefer:
-            return (random.choice(prefer), {"sensitive": False, "rule": "scandal"})
+    if "scandal" in categories and table["scandal"]:
+        return (random.choice(table["scandal"]), {"sensitive": False, "rule": "scandal"})
 
     # Sport/victory: prefer ✅ 🔥 😎
-    if any(kw in norm for kw in _REACTION_SPORT_KEYWORDS):
-        prefer = [e for e in ["✅", "🔥", "😎"] if e in candidates_set]
-        if prefer:
-            return (random.choice(prefer), {"sensitive": False, "rule": "sport"})
+    if "sport" in categories and table["sport"]:
+        return (random.choice(table["sport"]), {"sensitive": False, "rule": "sport"})
 
     # Boring: prefer 🥱
-    if any(kw in norm for kw in _REACTION_BORING_KEYWORDS):
-        if "🥱" in candidates_set:
-            return ("🥱", {"sensitive": False, "rule": "boring"})
+    if "boring" in categories and table["boring"]:
+        return ("🥱", {"sensitive": False, "rule": "boring"})
 
     return (random.choice(candidates), {"sensitive": False, "rule": "random"})
 
 
-def _reaction_ensure_date_reset(now: datetime) -> None:
-    """P1: clear daily structures when date changes (no restart)."""
-    global _REACTION_DAY
-    today = now.strftime("%Y-%m-%d")
-    if _REACTION_DAY is not None and _REACTION_DAY != today:
-        _REACTION_TODAY.clear()
-        _REACTION_POST_REACT_COUNT.clear()
-        _REACTION_POST_REACTED_BY.clear()
-    _REACTION_DAY = today
+def _day_key(now: datetime) -> str:
+    """Return YYYY-MM-DD for now, reusing the string while the date is unchanged."""
+    global _DAY_KEY_CACHE
+    day = now.date()
+    cached = _DAY_KEY_CACHE
+    if cached is not None and cached[0] == day:
+        return cached[1]
+    key = f"{day.year:04d}-{day.month:02d}-{day.day:02d}"
+    _DAY_KEY_CACHE = (day, key)
+    return key
 
 
-def _filter_bots_for_reaction(
+def _split_bots_for_reaction(
+    ledger: _ReactionLedger,
     available: list,
     chat_id: str,
-    now: datetime,
+    msg_id: int,
     cooldown_minutes: int,
     daily_limit: int,
-) -> list:
-    """Filter bots by reaction-specific cooldown and daily limit (in-memory)."""
-    today = now.strftime("%Y-%m-%d")
-    result = []
+    reply_names: set[str],
+) -> tuple[list, list, int]:
+    """One pass over bots: cooldown, daily limit and already-reacted checks (in-memory).
+
+    Returns (preferred, others, within_limits): preferred are eligible bots not replying
+    to this post, within_limits counts bots passing cooldown/limit before the post check.
+    """
+    preferred = []
+    others = []
+    within_limits = 0
+    cooldown_cutoff = time.monotonic() - cooldown_minutes * 60
     for item in available:
         account_name = item.account_name
-        key_last = (account_name, chat_id)
-        key_today = (account_name, chat_id, today)
-        last_at = _REACTION_LAST_AT.get(key_last)
-        if last_at:
-            elapsed = (now - last_at).total_seconds() / 60
-            if elapsed < cooldown_minutes:
-                continue
-        count = _REACTION_TODAY.get(key_today, 0)
-        if count >= daily_limit:
+        if not ledger.within_limits(account_name, chat_id, cooldown_cutoff, daily_limit):
             continue
-        result.append(item)
-    return result
-
-
-def _update_reaction_state(account_name: str, chat_id: str, now: datetime) -> None:
-    """Update in-memory reaction state after successful reaction."""
-    key_last = (account_name, chat_id)
-    key_today = (account_name, chat_id, now.strftime("%Y-%m-%d"))
-    _REACTION_LAST_AT[key_last] = now
-    _REACTION_TODAY[key_today] = _REACTION_TODAY.get(key_today, 0) + 1
-
-
-def _chat_reaction_ensure_date_reset(now: datetime) -> None:
-    """Reset chat reaction daily structures when date changes."""
-    global _CHAT_REACTION_DAY
-    today = now.strftime("%Y-%m-%d")
-    if _CHAT_REACTION_DAY is not None and _CHAT_REACTION_DAY != today:
-        _CHAT_REACTION_TODAY.clear()
-        _CHAT_REACTION_REACTED_TODAY.clear()
-    _CHAT_REACTION_DAY = today
-
-
-def _can_bot_chat_react(
-    account_name: str,
-    chat_id: str,
-    now: datetime,
-    cooldown_minutes: int,
-    daily_limit: int,
-) -> bool:
-    """Check if bot can put a chat reaction (cooldown and daily limit)."""
-    today = now.strftime("%Y-%m-%d")
-    key_last = (account_name, chat_id)
-    key_today = (account_name, chat_id, today)
-    last_at = _CHAT_REACTION_LAST_AT.get(key_last)
-    if last_at:
-        elapsed = (now - last_at).total_seconds() / 60
-        if elapsed < cooldown_minutes:
-            return False
-    count = _CHAT_REACTION_TODAY.get(key_today, 0)
-    return count < daily_limit
-
-
-def _update_chat_reaction_state(account_name: str, chat_id: str, msg_id: int, now: datetime) -> None:
-    """Update in-memory chat reaction state after successful reaction."""
-    today = now.strftime("%Y-%m-%d")
-    _CHAT_REACTION_LAST_AT[(account_name, chat_id)] = now
-    key_today = (account_name, chat_id, today)
-    _CHAT_REACTION_TODAY[key_today] = _CHAT_REACTION_TODAY.get(key_today, 0) + 1
-    _CHAT_REACTION_REACTED_TODAY[(chat_id, msg_id)] = today
+        within_limits += 1
+        if (chat_id, msg_id, account_name) in ledger.reacted:
+            continue
+        if account_name in reply_names:
+            others.append(item)
+        else:
+            preferred.append(item)
+    return (preferred, others, within_limits)
 
 
 async def _try_set_reaction_on_chat_message(
@@ -400,31 +519,34 @@ async def _try_set_reaction_on_chat_message(
     now: datetime,
 ) -> None:
     """Pipeline 2: optionally set reaction on user message we replied to."""
-    if not getattr(config, "CHAT_REACTIONS_ENABLED", False):
+    settings = _reaction_settings(config)
+    if not settings.chat_enabled:
         return
-    if getattr(config, "CHAT_REACTIONS_MODEL_DRIVEN", False):
+    if settings.chat_model_driven:
         return  # reactions set at plan-time by OpenAI
-    if not getattr(config, "CHAT_REACTION_ON_USER_MESSAGE", True):
+    if not settings.chat_on_user_message:
         return
-    _chat_reaction_ensure_date_reset(now)
-    today = now.strftime("%Y-%m-%d")
-    if _CHAT_REACTION_REACTED_TODAY.get((chat_id, message_id)) == today:
+    _CHAT_REACTIONS.roll_day(now)
+    if (chat_id, message_id) in _CHAT_REACTIONS.reacted:
         logger.info(
             "chat reaction skipped reason=pipeline2_user_message chat=%s msg_id=%s why=already_reacted_today",
             chat_id,
             message_id,
         )
         return
-    if random.random() >= getattr(config, "CHAT_REACTION_PROBABILITY", 0.15):
+    if random.random() >= settings.chat_probability:
         logger.info(
             "chat reaction skipped reason=pipeline2_user_message chat=%s msg_id=%s why=probability",
             chat_id,
             message_id,
         )
         return
-    cooldown = getattr(config, "CHAT_REACTION_COOLDOWN_MINUTES", 10)
-    daily_limit = getattr(config, "CHAT_REACTION_DAILY_LIMIT_PER_BOT", 20)
-    if not _can_bot_chat_react(account_name, chat_id, now, cooldown, daily_limit):
+    if not _CHAT_REACTIONS.within_limits(
+        account_name,
+        chat_id,
+        time.monotonic() - settings.chat_cooldown_minutes * 60,
+        settings.chat_daily_limit,
+    ):
         logger.info(
             "chat reaction skipped reason=pipeline2_user_message chat=%s msg_id=%s why=limit",
             chat_id,
@@ -440,8 +562,7 @@ async def _try_set_reaction_on_chat_message(
             account_name,
         )
         return
-    emojis = config.chat_reaction_emojis_list()
-    emoji, _ = _pick_reaction_emoji(message_text, emojis)
+    emoji, _ = _pick_reaction_emoji(message_text, settings.chat_emojis)
     logger.info(
         "chat reaction attempt reason=pipeline2_user_message chat=%s msg_id=%s bot=%s emoji=%s",
         chat_id,
@@ -451,7 +572,8 @@ async def _try_set_reaction_on_chat_message(
     )
     ok = await set_message_reaction(account.writer_client, chat_id, message_id, emoji)
     if ok:
-        _update_chat_reaction_state(account_name, chat_id, message_id, now)
+        _CHAT_REACTIONS.record(account_name, chat_id)
+        _CHAT_REACTIONS.reacted.add((chat_id, message_id))
         logger.info(
             "chat reaction set reason=pipeline2_user_message chat=%s msg_id=%s bot=%s emoji=%s",
             chat_id,
@@ -483,9 +605,10 @@ async def _try_set_reaction_on_news_post(
     selected_post_chat_id: str | None = None,
 ) -> None:
     """Pipeline 1: optionally set reaction(s) on the selected news post. No-op if disabled/skipped."""
-    if not getattr(config, "REACTIONS_ENABLED", False):
+    settings = _reaction_settings(config)
+    if not settings.enabled:
         return
-    _reaction_ensure_date_reset(now)
+    _CHANNEL_REACTIONS.roll_day(now)
     chat_id = selected_post_chat_id or source_channel
     msg_id: int | None = selected_post_message_id
     if msg_id is None:
@@ -499,27 +622,24 @@ async def _try_set_reaction_on_news_post(
             0,
         )
         return
-    today = now.strftime("%Y-%m-%d")
-    max_per_post = getattr(config, "REACTION_MAX_REACTIONS_PER_POST_PER_DAY", 1)
-    use_allowed = getattr(config, "REACTION_USE_ALLOWED_FROM_TELEGRAM", True)
-    sample_limit = getattr(config, "REACTION_ALLOWED_SAMPLE_LIMIT", 80)
-    min_bots = getattr(config, "REACTION_MIN_BOTS_PER_POST", 1)
-    cooldown = getattr(config, "REACTION_COOLDOWN_MINUTES", 30)
-    daily_limit = getattr(config, "REACTION_DAILY_LIMIT_PER_BOT", 10)
+    max_per_post = settings.max_per_post
+    min_bots = settings.min_bots
+    cooldown = settings.cooldown_minutes
+    daily_limit = settings.daily_limit
     reply_names = {b.account_name for b in selected_bots_for_replies}
 
     # Get emoji candidates: from Telegram allowed or config fallback
-    if use_allowed:
+    if settings.use_allowed:
         client = primary_account.reader_client
         allowed = await get_available_reaction_emojis(client, chat_id)
         if allowed:
-            candidates = allowed[:sample_limit]
+            candidates = tuple(allowed[: settings.sample_limit])
         else:
-            candidates = config.reaction_emojis_list()
+            candidates = settings.emojis
     else:
-        candidates = config.reaction_emojis_list()
+        candidates = settings.emojis
 
-    post_count = _REACTION_POST_REACT_COUNT.get((chat_id, msg_id), 0)
+    post_count = _CHANNEL_REACTIONS.post_counts.get((chat_id, msg_id), 0)
     attempts_limit = min(max_per_post - post_count, 3)
     if attempts_limit <= 0:
         logger.info(
@@ -528,7 +648,7 @@ async def _try_set_reaction_on_news_post(
             msg_id,
         )
         return
-    if random.random() >= config.REACTION_PROBABILITY:
+    if random.random() >= settings.probability:
         logger.info(
             "reaction skipped reason=pipeline1_news_post chat=%s msg_id=%s why=probability",
             chat_id,
@@ -537,7 +657,7 @@ async def _try_set_reaction_on_news_post(
         return
 
     for _ in range(attempts_limit):
-        post_count = _REACTION_POST_REACT_COUNT.get((chat_id, msg_id), 0)
+        post_count = _CHANNEL_REACTIONS.post_counts.get((chat_id, msg_id), 0)
         if post_count >= max_per_post:
             logger.info(
                 "reaction skipped reason=pipeline1_news_post chat=%s msg_id=%s why=post_daily_cap",
@@ -545,17 +665,17 @@ async def _try_set_reaction_on_news_post(
                 msg_id,
             )
             break
-        reaction_candidates = _filter_bots_for_reaction(
-            available_bots, chat_id, now, cooldown, daily_limit
-        )
-        # Exclude bots that already reacted to this post today
-        before_filter = len(reaction_candidates)
-        reaction_candidates = [
-            b for b in reaction_candidates
-            if _REACTION_POST_REACTED_BY.get((chat_id, msg_id, b.account_name)) != today
-        ]
-        if not reaction_candidates:
-            why = "bot_already_reacted" if before_filter > 0 else "limit"
+        preferred, others, within_limits = _split_bots_for_reaction(
+            _CHANNEL_REACTIONS,
+            available_bots,
+            chat_id,
+            msg_id,
+            cooldown,
+            daily_limit,
+            reply_names,
+        )
+        if not preferred and not others:
+            why = "bot_already_reacted" if within_limits > 0 else "limit"
             logger.info(
                 "reaction skipped reason=pipeline1_news_post chat=%s msg_id=%s why=%s",
                 chat_id,
@@ -563,8 +683,7 @@ async def _try_set_reaction_on_news_post(
                 why,
             )
             break
-        preferred = [b for b in reaction_candidates if b.account_name not in reply_names]
-        bot_row = random.choice(preferred) if preferred else random.choice(reaction_candidates)
+        bot_row = random.choice(preferred or others)
         account = accounts.get(bot_row.account_name)
         if not account or not account.writer_client:
             logger.info(
@@ -604,9 +723,9 @@ async def _try_set_reaction_on_news_post(
             )
             break
         if ok:
-            _update_reaction_state(bot_row.account_name, chat_id, now)
-            _REACTION_POST_REACT_COUNT[(chat_id, msg_id)] = post_count + 1
-            _REACTION_POST_REACTED_BY[(chat_id, msg_id, bot_row.account_name)] = today
+            _CHANNEL_REACTIONS.record(bot_row.account_name, chat_id)
+            _CHANNEL_REACTIONS.post_counts[(chat_id, msg_id)] = post_count + 1
+            _CHANNEL_REACTIONS.reacted.add((chat_id, msg_id, bot_row.account_name))
             new_count = post_count + 1
             logger.info(
                 "reaction set reason=pipeline1_news_post chat=%s msg_id=%s bot=%s emoji=%s post_count=%s/%s",
@@ -736,46 +855,59 @@ async def _try_set_admin_reaction_on_source_post(
         )
 
 
+# Один проход вместо четырёх: URL, @user и #tag -> пробел, числа -> "0"
+_FINGERPRINT_RE = re.compile(r"(?P<url>https?://\S+)|(?P<user>@\w+)|(?P<tag>#\w+)|(?P<digits>\d+)")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _fingerprint_replacement(match: re.Match[str]) -> str:
+    return "0" if match.lastgroup == "digits" else " "
+
+
 def normalize_text_for_fingerprint(text: str) -> str:
     """Normalize text for fingerprint: lowercase, no URLs, @user, #tag, digits->0, collapse spaces."""
     if not text or not isinstance(text, str):
         return ""
-    s = text.strip().lower()
-    s = re.sub(r"https?://\S+", " ", s)
-    s = re.sub(r"@\w+", " ", s)
-    s = re.sub(r"#\w+", " ", s)
-    s = re.sub(r"\d+", "0", s)
-    s = re.sub(r"\s+", " ", s).strip()
+    s = _FINGERPRINT_RE.sub(_fingerprint_replacement, text.strip().lower())
+    s = _WHITESPACE_RE.sub(" ", s).strip()
     return s[:800] if len(s) > 800 else s
 
 
+@lru_cache(maxsize=4096)
 def topic_fingerprint(text: str) -> str:
-    """Stable hash of normalized text for anti-repeat."""
+    """Stable hash of normalized text for anti-repeat (memoized: same posts recur every cycle)."""
     norm = normalize_text_for_fingerprint(text)
     return hashlib.sha256(norm.encode("utf-8")).hexdigest()[:16]
 
 
 def _parse_discussion_state_topics_json(raw: str | None) -> tuple[list[str], list[str]]:
     """Parse recent_topics_json. Returns (topics, fingerprints). Backward compat: list -> topics, fingerprints=[]."""
-    topics: list[str] = []
-    fingerprints: list[str] = []
-    s = (raw or "").strip()
+    topics, fingerprints = _parse_topics_json_cached((raw or "").strip())
+    return (list(topics), list(fingerprints))
+
+
+@lru_cache(maxsize=64)
+def _parse_topics_json_cached(s: str) -> tuple[tuple[str, ...], tuple[str, ...]]:
+    # Одна и та же строка состояния разбирается за цикл несколько раз (topics, fingerprints, update)
     if not s:
-        return (topics, fingerprints)
+        return ((), ())
     try:
-        data = json.loads(s)
+        data = json_loads(s)
     except json.JSONDecodeError:
-        return (topics, fingerprints)
+        return ((), ())
     if isinstance(data, list):
-        topics = [str(x).strip().lower() for x in data if str(x).strip()]
-        return (topics, fingerprints)
+        return (tuple(str(x).strip().lower() for x in data if str(x).strip()), ())
+    topics: tuple[str, ...] = ()
+    fingerprints: tuple[str, ...] = ()
     if isinstance(data, dict):
         raw_topics = data.get("topics")
         if isinstance(raw_topics, list):
-            topics = [str(x).strip().lower() for x in raw_topics if str(x).strip()]
+            topics = tuple(str(x).strip().lower() for x in raw_topics if str(x).strip())
         raw_fps = data.get("fingerprints")
         if isinstance(raw_fps, list):
-            fingerprints = [str(x).strip() for x in raw_fps if str(x).strip() and len(str(x)) <= 32]
+            fingerprints = tuple(
+                str(x).strip() for x in raw_fps if str(x).strip() and len(str(x)) <= 32
+            )
     return (topics, fingerprints)
 
 
@@ -785,7 +917,7 @@ def _save_discussion_state_topics_json(
     """Save topics + fingerprints as JSON object."""
     t = [x for x in topics[:topics_limit] if x]
     f = fingerprints[-fp_limit:] if len(fingerprints) > fp_limit else fingerprints
-    return json.dumps({"topics": t, "fingerprints": f}, ensure_ascii=False)
+    return json_dumps({"topics": t, "fingerprints": f})
 
 
 def _load_recent_topics(state: DiscussionState) -> list[str]:
@@ -807,7 +939,7 @@ def _load_recent_questions(state: DiscussionState) -> list[str]:
     if not raw:
         return []
     try:
-        data = json.loads(raw)
+        data = json_loads(raw)
         if isinstance(data, list):
             return [str(q).strip() for q in data if str(q).strip()][:_LAST_QUESTIONS_LIMIT]
     except json.JSONDecodeError:
@@ -824,7 +956,7 @@ def _update_recent_questions(state: DiscussionState, question: str, limit: int =
     if q in current:
         current.remove(q)
     current.insert(0, q)
-    state.recent_questions_json = json.dumps(current[:limit], ensure_ascii=False)
+    state.recent_questions_json = json_dumps(current[:limit])
 
 
 def _update_recent_topics(
@@ -835,15 +967,16 @@ def _update_recent_topics(
 ) -> None:
     normalized = [item.strip().lower() for item in topics if item and item.strip()]
     current_topics, current_fps = _parse_discussion_state_topics_json(state.recent_topics_json)
+    # Свежие темы в начале: OrderedDict даёт O(1) перенос без list.remove/insert
+    recent = OrderedDict.fromkeys(current_topics)
     for topic in normalized:
-        if topic in current_topics:
-            current_topics.remove(topic)
-        current_topics.insert(0, topic)
-    topics_out = current_topics[:_DISCUSSION_RECENT_TOPICS_LIMIT]
-    fps_out = list(current_fps)
+        recent[topic] = None
+        recent.move_to_end(topic, last=False)
+    topics_out = list(islice(recent, _DISCUSSION_RECENT_TOPICS_LIMIT))
+    fps_ring = deque(current_fps, maxlen=fingerprint_ring_size if fingerprint_ring_size > 0 else None)
     if add_fingerprint and add_fingerprint.strip():
-        fps_out.append(add_fingerprint.strip())
-        fps_out = fps_out[-fingerprint_ring_size:]
+        fps_ring.append(add_fingerprint.strip())
+    fps_out = list(fps_ring)
     if not normalized and not (add_fingerprint and add_fingerprint.strip()):
         return
     state.recent_topics_json = _save_discussion_state_topics_json(
@@ -857,6 +990,7 @@ async def run_service(
     """Run the main loop indefinitely."""
     pipelines: list[Pipeline] = []
     while True:
+        next_due_in: float | None = None
         try:
             with get_session() as session:
                 pipelines = get_all_pipelines(session)
@@ -949,6 +1083,9 @@ async def run_service(
                         config, accounts, account, session, pipeline
                     )
                     session.commit()
+                next_due_in = _seconds_until_next_due(
+                    pipelines, accounts, datetime.now(timezone.utc)
+                )
         except Exception:
             logger.exception("Unexpected error in main loop")
         sleep_min = config.SERVICE_SLEEP_MIN_SECONDS
@@ -959,6 +1096,9 @@ async def run_service(
         ):
             sleep_min = min(sleep_min, 30.0)
             sleep_max = min(sleep_max, 60.0)
+        if next_due_in is not None and sleep_min < next_due_in < sleep_max:
+            # Просыпаемся к ближайшему интервалу пайплайна; джиттер остаётся в [sleep_min, next_due_in]
+            sleep_max = next_due_in
         await _sleep_between_cycles(sleep_min, sleep_max)
 
 
@@ -1048,6 +1188,15 @@ async def _process_pipeline_once(
             state.current_source_index = (index + 1) % len(sources)
             return False
     if config.DEDUP_ENABLED and original_text:
+        if _is_exact_duplicate_post(session, pipeline.id, original_text):
+            logger.info(
+                "Skipping exact duplicate news in pipeline %s source %s",
+                pipeline.name,
+                source.source_channel,
+            )
+            source.last_message_id = message.id
+            state.current_source_index = (index + 1) % len(sources)
+            return False
         is_similar, _ = _is_similar_news_bm25(
             session,
             pipeline.id,
@@ -1155,6 +1304,11 @@ async def _process_pipeline_once(
     return True
 
 
+# Сколько ботов отвечают в обсуждении (P1): 1 — 60%, 2 — 30%, 3 — 10%; веса накопленные
+_DISCUSSION_REPLY_COUNTS = (1, 2, 3)
+_DISCUSSION_REPLY_COUNT_CUM_WEIGHTS = (60, 90, 100)
+
+
 async def _process_discussion_pipeline(
     config: Config,
     accounts: dict[str, AccountRuntime],
@@ -1298,6 +1452,8 @@ async def _process_discussion_pipeline(
         "discussion_candidates pipeline=%s source=%s total=%s",
         pipeline.name, settings.source_pipeline_name, len(candidates_all),
     )
+    # Темы каждого поста считаем один раз: нужны фильтру, весам ботов и recent_topics
+    topics_by_id = {c.message_id: extract_topics_for_text(c.text) for c in candidates_all}
     candidates = candidates_all
     removed_by_last_post = 0
     removed_by_topics = 0
@@ -1321,19 +1477,20 @@ async def _process_discussion_pipeline(
     # Keep reference to newest post so we can preserve it through topic/fingerprint/bm25 filters
     # (so the just-published post can get discussion and reactions).
     newest_candidate = candidates[0] if candidates else None
+    # Фильтры ниже сравнивают множества message_id, а не ищут кортежи в списках
+    always_keep_ids = {newest_candidate.message_id} if newest_candidate else set()
 
     recent_topics = set(_load_recent_topics(state))
     if recent_topics and len(candidates) > 1:
         before = len(candidates)
-        filtered_by_topics = [
-            item for item in candidates
-            if not recent_topics.intersection({t.lower() for t in extract_topics_for_text(item.text)})
-        ]
         # Always keep the newest post as a candidate so the just-published post
         # can get discussion and reactions even when its topics overlap with recent ones.
-        if newest_candidate and newest_candidate not in filtered_by_topics:
-            filtered_by_topics = [newest_candidate] + [c for c in filtered_by_topics if c != newest_candidate]
-        removed_ids = [c.message_id for c in candidates if c not in filtered_by_topics]
+        kept_ids = always_keep_ids | {
+            item.message_id for item in candidates
+            if recent_topics.isdisjoint(t.lower() for t in topics_by_id[item.message_id])
+        }
+        removed_ids = [c.message_id for c in candidates if c.message_id not in kept_ids]
+        filtered_by_topics = [c for c in candidates if c.message_id in kept_ids]
         candidates = filtered_by_topics
         removed_by_topics = before - len(candidates)
         if filtered_by_topics:
@@ -1351,10 +1508,11 @@ async def _process_discussion_pipeline(
     seen_fps = set(_load_recent_fingerprints(state))
     if seen_fps and len(candidates) > 1:
         before = len(candidates)
-        filtered_fp = [c for c in candidates if topic_fingerprint(c.text) not in seen_fps]
-        if newest_candidate and newest_candidate not in filtered_fp:
-            filtered_fp = [newest_candidate] + [c for c in filtered_fp if c != newest_candidate]
-        removed = [c for c in candidates if c not in filtered_fp]
+        kept_ids = always_keep_ids | {
+            c.message_id for c in candidates if topic_fingerprint(c.text) not in seen_fps
+        }
+        removed = [c for c in candidates if c.message_id not in kept_ids]
+        filtered_fp = [c for c in candidates if c.message_id in kept_ids]
         removed_ids = [c.message_id for c in removed]
         removed_fps = [topic_fingerprint(c.text) for c in removed]
         candidates = filtered_fp
@@ -1375,20 +1533,18 @@ async def _process_discussion_pipeline(
     bm25_threshold = getattr(config, "DEDUP_BM25_THRESHOLD", 10.5)
     if bm25_window > 0 and len(candidates) > 1:
         before = len(candidates)
-        filtered_bm25 = []
+        kept_ids = set(always_keep_ids)
         removed_with_scores: list[tuple[int, float]] = []
-        for c in candidates:
-            is_similar, max_score = _is_similar_news_bm25(
-                session, source_pipeline.id, c.text, bm25_window, bm25_threshold
-            )
+        bm25_results = _is_similar_news_bm25_batch(
+            session, source_pipeline.id, [c.text for c in candidates], bm25_window, bm25_threshold
+        )
+        for c, (is_similar, max_score) in zip(candidates, bm25_results):
             if not is_similar:
-                filtered_bm25.append(c)
+                kept_ids.add(c.message_id)
             else:
                 removed_with_scores.append((c.message_id, max_score))
-        if newest_candidate and newest_candidate not in filtered_bm25:
-            filtered_bm25 = [newest_candidate] + [c for c in filtered_bm25 if c != newest_candidate]
-        removed = [c for c in candidates if c not in filtered_bm25]
-        removed_ids = [c.message_id for c in removed]
+        removed_ids = [c.message_id for c in candidates if c.message_id not in kept_ids]
+        filtered_bm25 = [c for c in candidates if c.message_id in kept_ids]
         candidates = filtered_bm25
         if filtered_bm25:
             removed_by_bm25 = before - len(candidates)
@@ -1440,8 +1596,7 @@ async def _process_discussion_pipeline(
             message="selecting best post",
         )
         recent_topics_list = list(recent_topics)
-        selected_index, in_t, out_t, total_t = await asyncio.to_thread(
-            primary_account.openai_client.select_discussion_news,
+        selected_index, in_t, out_t, total_t = await primary_account.openai_client.select_discussion_news(
             candidate_texts,
             recent_topics=recent_topics_list,
             pipeline_id=pipeline.id,
@@ -1467,7 +1622,7 @@ async def _process_discussion_pipeline(
         "discussion_selected pipeline=%s msg_id=%s fp=%s idx=%s title_snippet=%s",
         pipeline.name, selected_item.message_id, sel_fp, selected_index, title_snippet,
     )
-    replies_count = random.choices([1, 2, 3], weights=[60, 30, 10])[0]
+    replies_count = random.choices(_DISCUSSION_REPLY_COUNTS, cum_weights=_DISCUSSION_REPLY_COUNT_CUM_WEIGHTS)[0]
     available_weights = _ensure_discussion_weights(
         session, pipeline.id, accounts, exclude_account=primary_account.name
     )
@@ -1486,7 +1641,7 @@ async def _process_discussion_pipeline(
         return sent_any
     replies_count = min(replies_count, len(available))
     try:
-        message_topics = extract_topics_for_text(news_text)
+        message_topics = topics_by_id[selected_item.message_id]
         effective_weights = _build_effective_weights(
             session,
             available,
@@ -1520,8 +1675,7 @@ async def _process_discussion_pipeline(
             message="generating discussion question",
         )
         last_questions = _load_recent_questions(state)
-        payload, in_t2, out_t2, total_t2 = await asyncio.to_thread(
-            primary_account.openai_client.generate_discussion_messages,
+        payload, in_t2, out_t2, total_t2 = await primary_account.openai_client.generate_discussion_messages(
             news_text,
             replies_count,
             roles,
@@ -1585,7 +1739,7 @@ async def _process_discussion_pipeline(
     state.last_source_post_at = _as_utc(selected_item.created_at) if selected_item.created_at else now
     _update_recent_topics(
         state,
-        extract_topics_for_text(news_text),
+        topics_by_id[selected_item.message_id],
         add_fingerprint=sel_fp,
         fingerprint_ring_size=fp_ring_size,
     )
@@ -1597,6 +1751,7 @@ async def _process_discussion_pipeline(
     state.last_reply_parent_id = question_message_id
     delay_factor = 1.5 - (discussion_level / 100.0)
     delay_factor = max(0.5, min(1.5, delay_factor))
+    planned_rows: list[dict] = []
     for idx, reply_text in enumerate(replies, start=1):
         # Planned chain for a single question; still keep persona roles per order.
         account_name = selected_bots[idx - 1].account_name
@@ -1614,14 +1769,16 @@ async def _process_discussion_pipeline(
         base_delay = _reply_delay_minutes(idx)
         adjusted_delay = max(1, int(round(base_delay * delay_factor)))
         send_at = now + timedelta(minutes=adjusted_delay)
-        create_discussion_reply(
-            session,
-            pipeline_id=pipeline.id,
-            account_name=account_name,
-            reply_text=reply_text,
-            send_at=send_at,
-            reply_to_message_id=None,
+        planned_rows.append(
+            {
+                "pipeline_id": pipeline.id,
+                "account_name": account_name,
+                "reply_text": reply_text,
+                "send_at": send_at,
+                "reply_to_message_id": None,
+            }
         )
+    create_discussion_replies(session, planned_rows)
     await _try_set_reaction_on_news_post(
         config,
         accounts,
@@ -1700,7 +1857,7 @@ def _localize_time(now_utc: datetime, tz_name: str) -> datetime:
 
 def _resolve_activity_windows(
     settings: DiscussionSettings, now_local: datetime
-) -> list[tuple[datetime.time, datetime.time]]:
+) -> tuple[tuple[datetime.time, datetime.time], ...]:
     is_weekend = now_local.weekday() >= 5
     raw = (
         settings.activity_windows_weekends_json
@@ -1710,15 +1867,17 @@ def _resolve_activity_windows(
     return _parse_activity_windows(raw)
 
 
+@lru_cache(maxsize=64)
 def _parse_activity_windows(
     raw: str | None,
-) -> list[tuple[datetime.time, datetime.time]]:
+) -> tuple[tuple[datetime.time, datetime.time], ...]:
+    # Кэш по сырой JSON-строке: окна меняются редко, а читаются каждый тик.
     if not raw:
-        return []
+        return ()
     try:
         data = json.loads(raw)
     except Exception:
-        return []
+        return ()
     windows: list[tuple[datetime.time, datetime.time]] = []
     for item in data:
         if not isinstance(item, (list, tuple)) or len(item) != 2:
@@ -1730,11 +1889,11 @@ def _parse_activity_windows(
         except Exception:
             continue
         windows.append((start_time, end_time))
-    return windows
+    return tuple(windows)
 
 
 def _is_within_windows(
-    now_local: datetime, windows: list[tuple[datetime.time, datetime.time]]
+    now_local: datetime, windows: Sequence[tuple[datetime.time, datetime.time]]
 ) -> bool:
     if not windows:
         return True
@@ -1818,12 +1977,12 @@ def _ensure_discussion_weights(
 def _load_persona_interest(
     session: Session, account_name: str
 ) -> tuple[list[str], int, int]:
-    persona = get_userbot_persona(session, account_name)
+    persona = get_userbot_persona_cached(session, account_name)
     topics_raw = persona.persona_topics if persona and persona.persona_topics else None
     topics: list[str] = []
     if topics_raw:
         try:
-            data = json.loads(topics_raw)
+            data = json_loads(topics_raw)
             if isinstance(data, list):
                 topics = [str(item) for item in data if str(item)]
         except Exception:
@@ -1940,15 +2099,26 @@ def _get_account_activity_levels(
     return discussion, replies
 
 
+def _roll_bot_daily_usage(row: DiscussionBotWeight, today: str) -> None:
+    """Reset the per-day usage counter when the stored day differs from today."""
+    if row.used_today_date != today:
+        row.used_today = 0
+        row.used_today_date = today
+
+
+def _roll_chat_daily_replies(chat_state: ChatState, today: str) -> None:
+    if chat_state.replies_today_date != today:
+        chat_state.replies_today = 0
+        chat_state.replies_today_date = today
+
+
 def _filter_available_bots(
     weights: list[DiscussionBotWeight], now: datetime
 ) -> list[DiscussionBotWeight]:
     available: list[DiscussionBotWeight] = []
-    today = now.strftime("%Y-%m-%d")
+    today = _day_key(now)
     for item in weights:
-        if item.used_today_date != today:
-            item.used_today = 0
-            item.used_today_date = today
+        _roll_bot_daily_usage(item, today)
         if item.used_today >= item.daily_limit:
             continue
         if item.last_used_at is not None:
@@ -2014,7 +2184,7 @@ def _build_persona_prompt_and_meta(
 ) -> tuple[str, dict[str, Any]]:
     """Строит человекочитаемый role_label и структурированные метаданные персоны.
     Возвращает (role_label, persona_meta). Без META-строки в role_label."""
-    persona = get_userbot_persona(session, account_name)
+    persona = get_userbot_persona_cached(session, account_name)
     tone = persona.persona_tone if persona and persona.persona_tone else "neutral"
     verbosity = (
         persona.persona_verbosity if persona and persona.persona_verbosity else "short"
@@ -2103,7 +2273,7 @@ def _format_persona_for_prompt(session: Session, account_name: str) -> str:
 
 
 def _persona_role_rank(session: Session, account_name: str) -> int:
-    persona = get_userbot_persona(session, account_name)
+    persona = get_userbot_persona_cached(session, account_name)
     tone = persona.persona_tone if persona and persona.persona_tone else "neutral"
     order = {
         "analytical": 0,
@@ -2122,6 +2292,18 @@ def _order_bots_for_chain(
     return sorted(bots, key=lambda item: _persona_role_rank(session, item.account_name))
 
 
+def _apply_reply_marks(
+    session: Session,
+    sent_ids: list[int],
+    sent_at: datetime,
+    cancelled: dict[str, list[int]],
+) -> None:
+    """Write collected reply statuses: one UPDATE for sent, one per cancel reason."""
+    mark_discussion_replies_sent(session, sent_ids, sent_at)
+    for reason, reply_ids in cancelled.items():
+        mark_discussion_replies_cancelled(session, reply_ids, reason)
+
+
 async def _send_due_discussion_replies(
     config: Config,
     accounts: dict[str, AccountRuntime],
@@ -2132,94 +2314,101 @@ async def _send_due_discussion_replies(
     state: DiscussionState,
     now: datetime,
 ) -> bool:
+    now_naive = naive_utc(now)
     due_replies = list_due_discussion_replies(
-        session, pipeline.id, now, kind="discussion"
+        session, pipeline.id, now_naive, kind="discussion"
     )
     if not due_replies:
         return False
     bot_ids = await _collect_bot_user_ids(accounts)
     sent_any = False
-    for reply in due_replies:
-        if not state.question_message_id or not state.question_created_at:
-            mark_discussion_reply_cancelled(session, reply, "no_question")
-            _update_pipeline_status(
-                pipeline,
-                category="pipeline1",
-                state="cancelled",
-                message=f"reply {reply.id}: no question",
-            )
-            continue
-        expires_at = _as_utc(state.expires_at)
-        if expires_at and now >= expires_at:
-            mark_discussion_reply_cancelled(session, reply, "expired")
-            _update_pipeline_status(
-                pipeline,
-                category="pipeline1",
-                state="cancelled",
-                message=f"reply {reply.id}: expired",
-            )
-            continue
-        if not await _discussion_still_valid(
-            primary_account.reader_client,
-            settings.target_chat,
-            state.question_message_id,
-            bot_ids,
-        ):
-            mark_discussion_reply_cancelled(session, reply, "topic_moved")
-            _update_pipeline_status(
-                pipeline,
-                category="pipeline1",
-                state="cancelled",
-                message=f"reply {reply.id}: topic moved",
-            )
-            continue
-        account = accounts.get(reply.account_name)
-        if not account:
-            mark_discussion_reply_cancelled(session, reply, "account_missing")
-            _update_pipeline_status(
-                pipeline,
-                category="pipeline1",
-                state="cancelled",
-                message=f"reply {reply.id}: account missing",
-            )
-            continue
-        reply_to_id = _pick_reply_parent(state, settings, reply)
-        try:
-            sent_message = await send_reply_text(
-                account.writer_client,
+    # Статусы копим и пишем одним UPDATE на состояние после цикла отправки
+    sent_ids: list[int] = []
+    cancelled: dict[str, list[int]] = {}
+    try:
+        for reply in due_replies:
+            if not state.question_message_id or not state.question_created_at:
+                cancelled.setdefault("no_question", []).append(reply.id)
+                _update_pipeline_status(
+                    pipeline,
+                    category="pipeline1",
+                    state="cancelled",
+                    message=f"reply {reply.id}: no question",
+                )
+                continue
+            expires_at = _as_utc(state.expires_at)
+            if expires_at and now >= expires_at:
+                cancelled.setdefault("expired", []).append(reply.id)
+                _update_pipeline_status(
+                    pipeline,
+                    category="pipeline1",
+                    state="cancelled",
+                    message=f"reply {reply.id}: expired",
+                )
+                continue
+            if not await _discussion_still_valid(
+                primary_account.reader_client,
                 settings.target_chat,
-                reply.reply_text,
-                reply_to_message_id=reply_to_id,
-                request_delay_seconds=account.behavior.TELEGRAM_REQUEST_DELAY_SECONDS,
-                random_jitter_seconds=account.behavior.RANDOM_JITTER_SECONDS,
-                flood_wait_antiblock=account.behavior.FLOOD_WAIT_ANTIBLOCK,
-                flood_wait_max_seconds=account.behavior.FLOOD_WAIT_MAX_SECONDS,
-                flood_wait_notify_after_seconds=pipeline.interval_seconds,
-            )
-        except Exception:
-            logger.exception(
-                "Discussion pipeline %s: failed to send reply", pipeline.name
-            )
+                state.question_message_id,
+                bot_ids,
+            ):
+                cancelled.setdefault("topic_moved", []).append(reply.id)
+                _update_pipeline_status(
+                    pipeline,
+                    category="pipeline1",
+                    state="cancelled",
+                    message=f"reply {reply.id}: topic moved",
+                )
+                continue
+            account = accounts.get(reply.account_name)
+            if not account:
+                cancelled.setdefault("account_missing", []).append(reply.id)
+                _update_pipeline_status(
+                    pipeline,
+                    category="pipeline1",
+                    state="cancelled",
+                    message=f"reply {reply.id}: account missing",
+                )
+                continue
+            reply_to_id = _pick_reply_parent(state, settings, reply)
+            try:
+                sent_message = await send_reply_text(
+                    account.writer_client,
+                    settings.target_chat,
+                    reply.reply_text,
+                    reply_to_message_id=reply_to_id,
+                    request_delay_seconds=account.behavior.TELEGRAM_REQUEST_DELAY_SECONDS,
+                    random_jitter_seconds=account.behavior.RANDOM_JITTER_SECONDS,
+                    flood_wait_antiblock=account.behavior.FLOOD_WAIT_ANTIBLOCK,
+                    flood_wait_max_seconds=account.behavior.FLOOD_WAIT_MAX_SECONDS,
+                    flood_wait_notify_after_seconds=pipeline.interval_seconds,
+                )
+            except Exception:
+                logger.exception(
+                    "Discussion pipeline %s: failed to send reply", pipeline.name
+                )
+                _update_pipeline_status(
+                    pipeline,
+                    category="pipeline1",
+                    state="cancelled",
+                    message=f"reply {reply.id}: send failed",
+                )
+                continue
+            sent_ids.append(reply.id)
+            state.replies_sent += 1
+            state.last_bot_reply_at = now
+            state.last_reply_parent_id = reply_to_id
+            state.last_bot_reply_message_id = getattr(sent_message, "id", None)
+            _update_bot_usage(session, pipeline.id, reply.account_name, now)
             _update_pipeline_status(
                 pipeline,
                 category="pipeline1",
-                state="cancelled",
-                message=f"reply {reply.id}: send failed",
+                state="sent",
+                message=f"bot {reply.account_name} -> {getattr(sent_message, 'id', None)}",
             )
-            continue
-        mark_discussion_reply_sent(session, reply, now)
-        state.replies_sent += 1
-        state.last_bot_reply_at = now
-        state.last_reply_parent_id = reply_to_id
-        state.last_bot_reply_message_id = getattr(sent_message, "id", None)
-        _update_bot_usage(session, pipeline.id, reply.account_name, now)
-        _update_pipeline_status(
-            pipeline,
-            category="pipeline1",
-            state="sent",
-            message=f"bot {reply.account_name} -> {getattr(sent_message, 'id', None)}",
-        )
-        sent_any = True
+            sent_any = True
+    finally:
+        _apply_reply_marks(session, sent_ids, now_naive, cancelled)
     return sent_any
 
 
@@ -2242,7 +2431,7 @@ def _pick_reply_parent(
 def _update_bot_usage(
     session: Session, pipeline_id: int, account_name: str, now: datetime
 ) -> None:
-    today = now.strftime("%Y-%m-%d")
+    today = _day_key(now)
     row = session.execute(
         select(DiscussionBotWeight).where(
             DiscussionBotWeight.pipeline_id == pipeline_id,
@@ -2251,9 +2440,7 @@ def _update_bot_usage(
     ).scalar_one_or_none()
     if row is None:
         return
-    if row.used_today_date != today:
-        row.used_today = 0
-        row.used_today_date = today
+    _roll_bot_daily_usage(row, today)
     row.used_today += 1
     row.last_used_at = now
 
@@ -2543,6 +2730,28 @@ def _is_candidate_for_reply(text: str, is_reply_to_bot: bool) -> bool:
     return any(trigger in lowered for trigger in triggers)
 
 
+# Сколько ботов отвечают пользователю (P2): 1 — 80%, 2 — 20%; веса накопленные
+_USER_REPLY_COUNTS = (1, 2)
+_USER_REPLY_COUNT_CUM_WEIGHTS = (80, 100)
+
+# Ограничение параллельных генераций ответов (OPENAI_MAX_CONCURRENT_REQUESTS под RPM-тариф).
+_USER_REPLY_GENERATION_LIMIT: asyncio.Semaphore | None = None
+
+
+def _user_reply_generation_limit(config: Config) -> asyncio.Semaphore:
+    global _USER_REPLY_GENERATION_LIMIT
+    if _USER_REPLY_GENERATION_LIMIT is None:
+        _USER_REPLY_GENERATION_LIMIT = asyncio.Semaphore(
+            max(1, config.OPENAI_MAX_CONCURRENT_REQUESTS)
+        )
+    return _USER_REPLY_GENERATION_LIMIT
+
+
+async def _generate_user_reply_limited(limit: asyncio.Semaphore, openai_client, **kwargs):
+    async with limit:
+        return await openai_client.generate_user_reply(**kwargs)
+
+
 async def _plan_user_reply_for_candidate(
     config: Config,
     accounts: dict[str, AccountRuntime],
@@ -2562,12 +2771,10 @@ async def _plan_user_reply_for_candidate(
         state="processing",
         message=f"message {candidate.get('message_id')}",
     )
-    today = now.strftime("%Y-%m-%d")
+    today = _day_key(now)
     _, reply_level = _get_account_activity_levels(config, pipeline.account_name)
     reply_factor = _activity_factor(reply_level)
-    if chat_state.replies_today_date != today:
-        chat_state.replies_today = 0
-        chat_state.replies_today_date = today
+    _roll_chat_daily_replies(chat_state, today)
     max_replies = settings.max_auto_replies_per_chat_per_day
     if max_replies > 0:
         max_replies = max(1, int(round(max_replies * reply_factor)))
@@ -2626,7 +2833,7 @@ async def _plan_user_reply_for_candidate(
                 message=f"message {candidate.get('message_id')}: inactive chat",
             )
             return False, None
-    replies_count = random.choices([1, 2], weights=[80, 20])[0]
+    replies_count = random.choices(_USER_REPLY_COUNTS, cum_weights=_USER_REPLY_COUNT_CUM_WEIGHTS)[0]
     available_weights = _ensure_discussion_weights(
         session, pipeline.id, accounts, exclude_account=primary_account.name
     )
@@ -2681,6 +2888,9 @@ async def _plan_user_reply_for_candidate(
         if not allowed_reactions:
             allowed_reactions = config.chat_reaction_emojis_list()
     null_rate = getattr(config, "CHAT_REACTIONS_MODEL_NULL_RATE", 0.65)
+    prepared: list[tuple[int, DiscussionBotWeight, AccountRuntime, dict[str, Any]]] = []
+    generations = []
+    generation_limit = _user_reply_generation_limit(config)
     for idx, bot_weight in enumerate(selected_bots, start=1):
         account = accounts.get(bot_weight.account_name)
         if not account:
@@ -2689,8 +2899,14 @@ async def _plan_user_reply_for_candidate(
             role_label, persona_meta = _build_persona_prompt_and_meta(
                 session, bot_weight.account_name
             )
-            reply_text, reaction_emoji, _, _, _, gen_info = await asyncio.to_thread(
-                account.openai_client.generate_user_reply,
+        except Exception:
+            logger.exception("user reply skipped: persona build failed")
+            continue
+        prepared.append((idx, bot_weight, account, persona_meta))
+        generations.append(
+            _generate_user_reply_limited(
+                generation_limit,
+                account.openai_client,
                 source_text=candidate["text"],
                 context_messages=context_messages,
                 role_label=role_label,
@@ -2707,8 +2923,14 @@ async def _plan_user_reply_for_candidate(
                 model_driven_reaction=model_driven,
                 reaction_null_rate=null_rate,
             )
-        except Exception:
-            logger.exception("user reply skipped: openai error")
+        )
+    # Ответы разных ботов независимы (общий контекст) — генерируем параллельно.
+    results = await asyncio.gather(*generations, return_exceptions=True)
+    for (idx, bot_weight, account, persona_meta), result in zip(prepared, results):
+        if isinstance(result, asyncio.CancelledError):
+            raise result
+        if isinstance(result, BaseException):
+            logger.error("user reply skipped: openai error", exc_info=result)
             _update_pipeline_status(
                 pipeline,
                 category="pipeline2",
@@ -2716,6 +2938,7 @@ async def _plan_user_reply_for_candidate(
                 message=f"message {candidate.get('message_id')}: openai error",
             )
             continue
+        reply_text, reaction_emoji, _, _, _, gen_info = result
         if not reply_text:
             continue
         gender = persona_meta.get("gender", "male")
@@ -2748,7 +2971,7 @@ async def _plan_user_reply_for_candidate(
             and getattr(config, "CHAT_REACTIONS_ENABLED", False)
             and account.writer_client
         ):
-            _chat_reaction_ensure_date_reset(now)
+            _CHAT_REACTIONS.roll_day(now)
             logger.info(
                 "chat reaction model candidate chat=%s msg_id=%s emoji=%s allowed_count=%s source=model",
                 candidate["chat_id"],
@@ -2763,12 +2986,8 @@ async def _plan_user_reply_for_candidate(
                 reaction_emoji,
             )
             if ok:
-                _update_chat_reaction_state(
-                    bot_weight.account_name,
-                    candidate["chat_id"],
-                    candidate["message_id"],
-                    now,
-                )
+                _CHAT_REACTIONS.record(bot_weight.account_name, candidate["chat_id"])
+                _CHAT_REACTIONS.reacted.add((candidate["chat_id"], candidate["message_id"]))
                 logger.info(
                     "chat reaction set reason=pipeline2_user_message chat=%s msg_id=%s bot=%s emoji=%s source=model",
                     candidate["chat_id"],
@@ -2846,8 +3065,9 @@ async def _send_due_user_replies(
     *,
     allow_send: bool,
 ) -> None:
+    now_naive = naive_utc(now)
     due_replies = list_due_discussion_replies(
-        session, pipeline.id, now, kind="user_reply"
+        session, pipeline.id, now_naive, kind="user_reply"
     )
     if not due_replies:
         return
@@ -2866,8 +3086,10 @@ async def _send_due_user_replies(
         message=f"sending {len(due_replies)} of {total_due} due replies",
     )
     if not allow_send:
+        mark_discussion_replies_cancelled(
+            session, [reply.id for reply in due_replies], "outside activity window"
+        )
         for reply in due_replies:
-            mark_discussion_reply_cancelled(session, reply, "outside activity window")
             _update_pipeline_status(
                 pipeline,
                 category="pipeline2",
@@ -2885,8 +3107,10 @@ async def _send_due_user_replies(
     if effective_inactivity > 0 and chat_state.last_human_message_at:
         delta = now - chat_state.last_human_message_at.replace(tzinfo=timezone.utc)
         if delta.total_seconds() > effective_inactivity * 60:
+            mark_discussion_replies_cancelled(
+                session, [reply.id for reply in due_replies], "inactive chat"
+            )
             for reply in due_replies:
-                mark_discussion_reply_cancelled(session, reply, "inactive chat")
                 logger.info("user reply cancelled: inactive chat")
                 _update_pipeline_status(
                     pipeline,
@@ -2895,119 +3119,122 @@ async def _send_due_user_replies(
                     message=f"reply {reply.id}: inactive chat",
                 )
             return
-    for reply in due_replies:
-        if reply.reply_to_message_id is None:
-            mark_discussion_reply_cancelled(session, reply, "missing reply_to")
+    sent_ids: list[int] = []
+    cancelled: dict[str, list[int]] = {}
+    try:
+        for reply in due_replies:
+            if reply.reply_to_message_id is None:
+                cancelled.setdefault("missing reply_to", []).append(reply.id)
+                _update_pipeline_status(
+                    pipeline,
+                    category="pipeline2",
+                    state="cancelled",
+                    message=f"reply {reply.id}: missing reply_to",
+                )
+                continue
+            if settings.user_reply_max_age_minutes > 0:
+                if reply.source_message_at:
+                    source_time = reply.source_message_at
+                    if source_time.tzinfo is None:
+                        source_time = source_time.replace(tzinfo=timezone.utc)
+                    age = (now - source_time).total_seconds() / 60
+                else:
+                    send_at = reply.send_at
+                    if send_at and send_at.tzinfo is None:
+                        send_at = send_at.replace(tzinfo=timezone.utc)
+                    age = (now - send_at).total_seconds() / 60 if send_at else 0
+                if age > settings.user_reply_max_age_minutes:
+                    cancelled.setdefault("message too old", []).append(reply.id)
+                    ref_ts = source_time if reply.source_message_at else reply.send_at
+                    logger.info(
+                        "user reply cancelled: message too old (reply %s: age=%.1f min, limit=%s min, now_utc=%s, ref_utc=%s)",
+                        reply.id,
+                        age,
+                        settings.user_reply_max_age_minutes,
+                        now.isoformat(),
+                        ref_ts.isoformat() if ref_ts else str(ref_ts),
+                    )
+                    _update_pipeline_status(
+                        pipeline,
+                        category="pipeline2",
+                        state="cancelled",
+                        message=f"reply {reply.id}: message too old",
+                    )
+                    continue
+            account = accounts.get(reply.account_name)
+            if not account:
+                cancelled.setdefault("account_missing", []).append(reply.id)
+                _update_pipeline_status(
+                    pipeline,
+                    category="pipeline2",
+                    state="cancelled",
+                    message=f"reply {reply.id}: account missing",
+                )
+                continue
+            if not _can_use_bot_for_reply(session, pipeline.id, reply.account_name, now):
+                cancelled.setdefault("cooldown/limit", []).append(reply.id)
+                logger.info("user reply cancelled: cooldown/limits")
+                _update_pipeline_status(
+                    pipeline,
+                    category="pipeline2",
+                    state="cancelled",
+                    message=f"reply {reply.id}: cooldown/limits",
+                )
+                continue
             _update_pipeline_status(
                 pipeline,
                 category="pipeline2",
-                state="cancelled",
-                message=f"reply {reply.id}: missing reply_to",
+                state="processing",
+                message=f"sending reply {reply.id}",
             )
-            continue
-        if settings.user_reply_max_age_minutes > 0:
-            if reply.source_message_at:
-                source_time = reply.source_message_at
-                if source_time.tzinfo is None:
-                    source_time = source_time.replace(tzinfo=timezone.utc)
-                age = (now - source_time).total_seconds() / 60
-            else:
-                send_at = reply.send_at
-                if send_at and send_at.tzinfo is None:
-                    send_at = send_at.replace(tzinfo=timezone.utc)
-                age = (now - send_at).total_seconds() / 60 if send_at else 0
-            if age > settings.user_reply_max_age_minutes:
-                mark_discussion_reply_cancelled(session, reply, "message too old")
-                ref_ts = source_time if reply.source_message_at else reply.send_at
-                logger.info(
-                    "user reply cancelled: message too old (reply %s: age=%.1f min, limit=%s min, now_utc=%s, ref_utc=%s)",
-                    reply.id,
-                    age,
-                    settings.user_reply_max_age_minutes,
-                    now.isoformat(),
-                    ref_ts.isoformat() if ref_ts else str(ref_ts),
+            try:
+                sent = await send_reply_text(
+                    account.writer_client,
+                    reply.chat_id or settings.target_chat,
+                    reply.reply_text,
+                    reply_to_message_id=reply.reply_to_message_id,
+                    request_delay_seconds=account.behavior.TELEGRAM_REQUEST_DELAY_SECONDS,
+                    random_jitter_seconds=account.behavior.RANDOM_JITTER_SECONDS,
+                    flood_wait_antiblock=account.behavior.FLOOD_WAIT_ANTIBLOCK,
+                    flood_wait_max_seconds=account.behavior.FLOOD_WAIT_MAX_SECONDS,
+                    flood_wait_notify_after_seconds=pipeline.interval_seconds,
                 )
+            except Exception as exc:
+                logger.exception("user reply cancelled: send failed")
+                cancelled.setdefault(
+                    f"send failed: {exc.__class__.__name__}", []
+                ).append(reply.id)
                 _update_pipeline_status(
                     pipeline,
                     category="pipeline2",
                     state="cancelled",
-                    message=f"reply {reply.id}: message too old",
+                    message=f"reply {reply.id}: send failed",
                 )
                 continue
-        account = accounts.get(reply.account_name)
-        if not account:
-            mark_discussion_reply_cancelled(session, reply, "account_missing")
-            _update_pipeline_status(
-                pipeline,
-                category="pipeline2",
-                state="cancelled",
-                message=f"reply {reply.id}: account missing",
+            sent_ids.append(reply.id)
+            _update_bot_usage(session, pipeline.id, reply.account_name, now)
+            logger.info(
+                "user reply sent: bot %s -> %s",
+                reply.account_name,
+                getattr(sent, "id", None),
             )
-            continue
-        if not _can_use_bot_for_reply(session, pipeline.id, reply.account_name, now):
-            mark_discussion_reply_cancelled(session, reply, "cooldown/limit")
-            logger.info("user reply cancelled: cooldown/limits")
             _update_pipeline_status(
                 pipeline,
                 category="pipeline2",
-                state="cancelled",
-                message=f"reply {reply.id}: cooldown/limits",
+                state="sent",
+                message=f"bot {reply.account_name} -> {getattr(sent, 'id', None)}",
             )
-            continue
-        _update_pipeline_status(
-            pipeline,
-            category="pipeline2",
-            state="processing",
-            message=f"sending reply {reply.id}",
-        )
-        try:
-            sent = await send_reply_text(
-                account.writer_client,
+            await _try_set_reaction_on_chat_message(
+                config,
+                accounts,
+                reply.account_name,
                 reply.chat_id or settings.target_chat,
-                reply.reply_text,
-                reply_to_message_id=reply.reply_to_message_id,
-                request_delay_seconds=account.behavior.TELEGRAM_REQUEST_DELAY_SECONDS,
-                random_jitter_seconds=account.behavior.RANDOM_JITTER_SECONDS,
-                flood_wait_antiblock=account.behavior.FLOOD_WAIT_ANTIBLOCK,
-                flood_wait_max_seconds=account.behavior.FLOOD_WAIT_MAX_SECONDS,
-                flood_wait_notify_after_seconds=pipeline.interval_seconds,
+                reply.reply_to_message_id,
+                "",  # message_text for sensitive check; empty is ok
+                now,
             )
-        except Exception as exc:
-            logger.exception("user reply cancelled: send failed")
-            mark_discussion_reply_cancelled(
-                session,
-                reply,
-                f"send failed: {exc.__class__.__name__}",
-            )
-            _update_pipeline_status(
-                pipeline,
-                category="pipeline2",
-                state="cancelled",
-                message=f"reply {reply.id}: send failed",
-            )
-            continue
-        mark_discussion_reply_sent(session, reply, now)
-        _update_bot_usage(session, pipeline.id, reply.account_name, now)
-        logger.info(
-            "user reply sent: bot %s -> %s",
-            reply.account_name,
-            getattr(sent, "id", None),
-        )
-        _update_pipeline_status(
-            pipeline,
-            category="pipeline2",
-            state="sent",
-            message=f"bot {reply.account_name} -> {getattr(sent, 'id', None)}",
-        )
-        await _try_set_reaction_on_chat_message(
-            config,
-            accounts,
-            reply.account_name,
-            reply.chat_id or settings.target_chat,
-            reply.reply_to_message_id,
-            "",  # message_text for sensitive check; empty is ok
-            now,
-        )
+    finally:
+        _apply_reply_marks(session, sent_ids, now_naive, cancelled)
 
 
 def _can_use_bot_for_reply(
@@ -3021,10 +3248,8 @@ def _can_use_bot_for_reply(
     ).scalar_one_or_none()
     if row is None:
         return False
-    today = now.strftime("%Y-%m-%d")
-    if row.used_today_date != today:
-        row.used_today = 0
-        row.used_today_date = today
+    today = _day_key(now)
+    _roll_bot_daily_usage(row, today)
     if row.used_today >= row.daily_limit:
         return False
     if row.last_used_at is not None:
@@ -3037,6 +3262,11 @@ def _can_use_bot_for_reply(
     return True
 
 
+async def _describe_source_photo(reader_client, openai_client, message) -> str:
+    image_bytes = await download_message_photo(reader_client, message)
+    return await openai_client.describe_image_for_news(image_bytes)
+
+
 async def _post_message(
     config: Config,
     account: AccountRuntime,
@@ -3136,9 +3366,7 @@ async def _post_message(
         text = original_text
         if apply_blackbox:
             text = f"[BLACKBOX]\n{text}"
-        paraphrased, in_tokens, out_tokens, total_tokens = await asyncio.to_thread(
-            openai_client.paraphrase_news, text
-        )
+        paraphrased, in_tokens, out_tokens, total_tokens = await openai_client.paraphrase_news(text)
         if apply_blackbox and getattr(config, "BLACKBOX_CASE_DISTORT", False):
             paraphrased = _apply_blackbox_effect(
                 paraphrased,
@@ -3195,9 +3423,18 @@ async def _post_message(
     text = original_text
     if apply_blackbox:
         text = f"[BLACKBOX]\n{text}"
-    paraphrased, in_tokens, out_tokens, total_tokens = await asyncio.to_thread(
-        openai_client.paraphrase_news, text
-    )
+    # Режим с картинкой: скачивание и описание фото идут параллельно пересказу текста
+    describe_task: asyncio.Task[str] | None = None
+    if posting_mode != "TEXT" and message.photo:
+        describe_task = asyncio.create_task(
+            _describe_source_photo(reader_client, openai_client, message)
+        )
+    try:
+        paraphrased, in_tokens, out_tokens, total_tokens = await openai_client.paraphrase_news(text)
+    except BaseException:
+        if describe_task is not None:
+            describe_task.cancel()
+        raise
     if apply_blackbox and getattr(config, "BLACKBOX_CASE_DISTORT", False):
         paraphrased = _apply_blackbox_effect(
             paraphrased,
@@ -3268,15 +3505,13 @@ async def _post_message(
         )
         return sent_msg
 
-    image_bytes = await download_message_photo(reader_client, message)
-    description = await asyncio.to_thread(
-        openai_client.describe_image_for_news, image_bytes
+    description = await describe_task
+    generated_bytes, image_tokens, image_cached = (
+        await openai_client.generate_image_from_description(description)
     )
-    generated_bytes, image_tokens = await asyncio.to_thread(
-        openai_client.generate_image_from_description, description
-    )
-    image_count = 1
-    image_cost = account.openai_settings.image_price_1024_usd
+    if not image_cached:
+        image_count = 1
+        image_cost = account.openai_settings.image_price_1024_usd
     sent_msg = await send_image_with_caption(
         writer_client,
         destination_channel,
@@ -3584,6 +3819,14 @@ _STOPWORDS_RU = {
 }
 
 
+def _build_bm25_index(texts: list[str | None]) -> BM25Okapi | None:
+    """BM25 index over tokenized texts; None when no text has significant words."""
+    corpus_tokens = [tokens for tokens in map(_tokenize, (t or "" for t in texts)) if tokens]
+    if not corpus_tokens:
+        return None
+    return BM25Okapi(corpus_tokens)
+
+
 def _is_similar_news_bm25(
     session: Session,
     pipeline_id: int,
@@ -3595,38 +3838,88 @@ def _is_similar_news_bm25(
     Excludes the candidate text itself from corpus to avoid self-match inflation.
     Returns (is_similar, max_score) for logging.
     """
-    if window_size <= 0:
-        return (False, 0.0)
-    recent_texts = (
-        session.execute(
-            select(PostHistory.text)
-            .where(PostHistory.pipeline_id == pipeline_id)
-            .order_by(PostHistory.id.desc())
-            .limit(window_size)
+    return _is_similar_news_bm25_batch(session, pipeline_id, [text], window_size, threshold)[0]
+
+
+def _is_similar_news_bm25_batch(
+    session: Session,
+    pipeline_id: int,
+    texts: list[str],
+    window_size: int,
+    threshold: float,
+) -> list[tuple[bool, float]]:
+    """BM25 check for several texts against one fetch of the post_history window.
+    The index over the window is cached per pipeline until a new post enters it;
+    a text already in the window is scored against a one-off index without itself.
+    Returns (is_similar, max_score) per text, in order.
+    """
+    results = [(False, 0.0)] * len(texts)
+    if window_size <= 0 or not texts:
+        return results
+    recent_rows = session.execute(
+        select(PostHistory.id, PostHistory.text)
+        .where(PostHistory.pipeline_id == pipeline_id)
+        .order_by(PostHistory.id.desc())
+        .limit(window_size)
+    ).all()
+    if not recent_rows:
+        return results
+    window_texts = {(t or "").strip() for _, t in recent_rows}
+    window_index: BM25Okapi | None = None
+    window_index_ready = False
+    for i, text in enumerate(texts):
+        query_tokens = _tokenize(text)
+        if not query_tokens:
+            continue
+        text_stripped = text.strip()
+        if text_stripped in window_texts:
+            # Кандидат уже в окне: строим разовый индекс без него, кэш не трогаем
+            bm25 = _build_bm25_index(
+                [t for _, t in recent_rows if (t or "").strip() != text_stripped]
+            )
+        else:
+            if not window_index_ready:
+                window_index = _cached_window_bm25_index(pipeline_id, recent_rows)
+                window_index_ready = True
+            bm25 = window_index
+        if bm25 is None:
+            continue
+        scores = bm25.get_scores(query_tokens)
+        max_score = max(scores) if len(scores) > 0 else 0.0
+        results[i] = (max_score >= threshold, max_score)
+    return results
+
+
+def _cached_window_bm25_index(pipeline_id: int, recent_rows: Sequence) -> BM25Okapi | None:
+    """BM25 index over the whole window, reused while its post ids are unchanged."""
+    window_ids = tuple(row_id for row_id, _ in recent_rows)
+    cached = _BM25_INDEX_CACHE.get(pipeline_id)
+    if cached is not None and cached[0] == window_ids:
+        return cached[1]
+    bm25 = _build_bm25_index([t for _, t in recent_rows])
+    if bm25 is not None:
+        _BM25_INDEX_CACHE[pipeline_id] = (window_ids, bm25)
+    return bm25
+
+
+def _post_text_hash(text: str) -> int:
+    """Signed 64-bit hash of stripped text (fits SQLite INTEGER)."""
+    digest = hashlib.blake2b(text.strip().encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def _is_exact_duplicate_post(session: Session, pipeline_id: int, text: str) -> bool:
+    """Index probe on (pipeline_id, text_hash); confirms on text to rule out collisions."""
+    stripped = text.strip()
+    row = session.execute(
+        select(PostHistory.text)
+        .where(
+            PostHistory.pipeline_id == pipeline_id,
+            PostHistory.text_hash == _post_text_hash(stripped),
         )
-        .scalars()
-        .all()
-    )
-    if not recent_texts:
-        return (False, 0.0)
-    text_stripped = text.strip()
-    recent_texts = [t for t in recent_texts if (t or "").strip() != text_stripped]
-    if not recent_texts:
-        return (False, 0.0)
-    query_tokens = _tokenize(text)
-    if not query_tokens:
-        return (False, 0.0)
-    corpus_tokens = []
-    for item in recent_texts:
-        tokens = _tokenize(item)
-        if tokens:
-            corpus_tokens.append(tokens)
-    if not corpus_tokens:
-        return (False, 0.0)
-    bm25 = BM25Okapi(corpus_tokens)
-    scores = bm25.get_scores(query_tokens)
-    max_score = max(scores) if len(scores) > 0 else 0.0
-    return (max_score >= threshold, max_score)
+        .limit(1)
+    ).scalar_one_or_none()
+    return row is not None and row.strip() == stripped
 
 
 def _store_recent_post(
@@ -3643,11 +3936,38 @@ def _store_recent_post(
             pipeline_id=pipeline_id,
             text=text,
             created_at=datetime.utcnow(),
+            text_hash=_post_text_hash(text),
             destination_channel=destination_channel,
             channel_message_id=channel_message_id,
         )
     )
     session.flush()
+    _trim_post_history(session, pipeline_id, window_size)
+
+
+def _store_recent_posts(
+    session: Session, pipeline_id: int, texts: list[str], window_size: int
+) -> None:
+    """Insert several history rows in one executemany, then trim the window once."""
+    if not texts:
+        return
+    created_at = datetime.utcnow()
+    session.execute(
+        insert(PostHistory),
+        [
+            {
+                "pipeline_id": pipeline_id,
+                "text": text,
+                "created_at": created_at,
+                "text_hash": _post_text_hash(text),
+            }
+            for text in texts
+        ],
+    )
+    _trim_post_history(session, pipeline_id, window_size)
+
+
+def _trim_post_history(session: Session, pipeline_id: int, window_size: int) -> None:
     if window_size <= 0:
         return
     excess_ids = (
@@ -3712,6 +4032,37 @@ def _is_semantically_similar_to_recent(
     return False
 
 
+def _seconds_until_next_due(
+    pipelines: list[Pipeline], accounts: dict[str, AccountRuntime], now: datetime
+) -> float | None:
+    """Seconds until the earliest runnable pipeline is due (0 if one is due now).
+
+    Pipelines without a runtime account are ignored; for an account in flood wait
+    the pipeline is due no earlier than the flood wait expiry.
+    """
+    now_naive = naive_utc(now)
+    earliest: float | None = None
+    for pipeline in pipelines:
+        if not pipeline.is_enabled:
+            continue
+        account = accounts.get(pipeline.account_name or "default")
+        if account is None:
+            continue
+        state = pipeline.state
+        if state is None or state.last_run_at is None:
+            left = 0.0
+        else:
+            left = pipeline.interval_seconds - (now_naive - state.last_run_at).total_seconds()
+        flood_until = _as_utc(account.flood_wait_until)
+        if flood_until is not None:
+            left = max(left, (flood_until - now).total_seconds())
+        if earliest is None or left < earliest:
+            earliest = left
+    if earliest is None:
+        return None
+    return max(0.0, earliest)
+
+
 async def _sleep_between_cycles(min_seconds: float, max_seconds: float) -> None:
     if max_seconds <= 0:
         return
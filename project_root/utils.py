@@ -2,7 +2,29 @@
 
 from __future__ import annotations
 
+import json
+from typing import Any
+
+try:  # быстрый JSON (ответы модели, JSON-поля в БД); без него — stdlib json
+    import orjson
+except ImportError:  # pragma: no cover - orjson не установлен
+    orjson = None
+
 
 def is_text_long_enough(text: str, min_length: int) -> bool:
     """Check if text length meets the minimum requirement."""
     return len(text.strip()) >= min_length
+
+
+def json_loads(text: str | bytes) -> Any:
+    """Parse JSON with orjson when available (its JSONDecodeError subclasses json's)."""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def json_dumps(value: Any) -> str:
+    """Serialize to compact JSON without escaping non-ASCII characters."""
+    if orjson is not None:
+        return orjson.dumps(value).decode("utf-8")
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))